@@ -1,6 +1,8 @@
 import random
+import numpy as np
 from shared.probabilities import handler
 from shared.ai import agent
+from shared.api.state_watcher import StateWatcher
 
 
 def normalise(arr):
@@ -22,12 +24,17 @@ class ConservativeAgent(agent.Agent):
         A simple, conservative agent.
     """
 
-    def __init__(self, base_url=None):
-        super(ConservativeAgent, self).__init__(base_url)
+    def __init__(self, base_url=None, game_manager=None):
+        super(ConservativeAgent, self).__init__(base_url, game_manager)
         self.nickname = "Dazhbog"
 
     @staticmethod
-    def determine_action(game_state):
+    def determine_action(game_state, rng=None):
+        """
+            rng: random.Random making the agent's random choices, the random module by default
+            return: action_id(int)
+        """
+        rng = rng if rng is not None else random
         agent_nickname = game_state["cp_nickname"]
         matching_hands = [hand for hand in game_state.get("hands", []) if hand.get("nickname") == agent_nickname]
         if len(matching_hands) != 1:
@@ -39,7 +46,7 @@ class ConservativeAgent(agent.Agent):
         if not players or not others_card_num:
             raise ValueError("Can't get my hand or other player's card numbers from the game state.")
 
-        bet_probs = handler.Handler().get_probability_vector(hand, others_card_num)
+        bet_probs = handler.get_shared_handler().get_probability_vector(hand, others_card_num)
         last_bet = None
         if game_state.get("history"):
             last_bet = game_state.get("history")[-1]["action_id"]
@@ -62,42 +69,67 @@ class ConservativeAgent(agent.Agent):
             if sum(check_vs_bet_probs) == 0:
                 return 88
 
-            check = random.choices([True, False], weights=normalise(check_vs_bet_probs), k=1)[0]
+            check = rng.choices([True, False], weights=normalise(check_vs_bet_probs), k=1)[0]
             if check:
                 return 88
 
         sampling_weights = compute_sampling_weights(bet_probs)
-        sampled_action = random.choices(range(len(sampling_weights)), weights=sampling_weights, k=1)[0]
+        sampled_action = rng.choices(range(len(sampling_weights)), weights=sampling_weights, k=1)[0]
 
         return sampled_action
 
-    def run(self):
+    @staticmethod
+    def determine_actions(hand_masks, others_card_nums, last_bets, rng=None):
+        """
+            Batch version of determine_action, e.g. for shared.api.batched_local_manager
+            hand_masks: N card masks of the current players' hands
+            others_card_nums: N numbers of cards of the other players
+            last_bets: N last action ids of the round, negative if there's none
+            rng: np.random.Generator
+            return: actions(np.ndarray of shape (N,))
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        last_bets = np.asarray(last_bets)
+        bet_probs = handler.get_shared_handler().get_probability_matrix(np.asarray(hand_masks), others_card_nums)
+        games = np.arange(len(bet_probs))
+        has_last_bet = last_bets >= 0
+        last_bet_probs = np.where(has_last_bet, bet_probs[games, np.maximum(last_bets, 0)], 1.0)
+
+        bet_probs[np.arange(88) <= last_bets[:, None]] = 0.0
+        sampling_weights = bet_probs ** 3  # Be conservative
+        weight_sums = sampling_weights.sum(axis=1)
+        sampling_weights /= np.where(weight_sums > 0, weight_sums, 1.0)[:, None]
+
+        success_prob_of_check = 1 - last_bet_probs
+        success_prob_of_bet = (sampling_weights * bet_probs).sum(axis=1)
+        check_weight = success_prob_of_check ** 3  # Be conservative
+        bet_weight = (success_prob_of_bet * 1.2) ** 3
+        total_weight = check_weight + bet_weight
+        check = has_last_bet & ((last_bet_probs == 0) | (total_weight == 0) |
+                                (rng.random(len(bet_probs)) * np.where(total_weight > 0, total_weight, 1.0) < check_weight))
+
+        cumulative_weights = sampling_weights.cumsum(axis=1)
+        sampled_actions = (cumulative_weights < rng.random(len(bet_probs))[:, None] * cumulative_weights[:, -1:]).sum(axis=1)
+        return np.where(check | (weight_sums == 0), 88, np.minimum(sampled_actions, 87))
+
+    def run(self, long_poll=None):
         """
             Play the game.
+            long_poll: seconds the engine may hold each game state fetch, see StateWatcher
         """
         if not self.joined_game:
             print("I have not joined any game yet")
             return
-        done = False
-        while not done:
-            succeeded, game_state = self.game_manager.get_game_state()
-            if not succeeded:
-                print("Can't get the game state.")
-                continue
-
+        watcher = StateWatcher(self.game_manager, self.nickname, long_poll=long_poll)
+        while True:
+            game_state = watcher.wait_for_turn()
             if game_state.get("status") != "Running":
-                if game_state.get("status") == "Not started":
-                    print("Game not yet started")
-                else:
-                    print("Game finished")
-                    break
-                continue
-
-            if game_state.get("cp_nickname") != self.nickname:
-                continue
-
-            sampled_action = determine_action(game_state, self.nickname)
-            self.game_manager.play(sampled_action)
+                print("Game finished")
+                break
+
+            sampled_action = determine_action(game_state)
+            if not self.game_manager.play(sampled_action):
+                watcher.forget_turn()
 
 
 # Expose determine_action for import
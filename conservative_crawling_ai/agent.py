@@ -1,6 +1,7 @@
 import random
 from shared.probabilities import handler
 from shared.ai import agent
+from shared.api.state_watcher import StateWatcher
 
 
 def normalise(arr):
@@ -24,12 +25,17 @@ class ConservativeCrawlingAgent(agent.Agent):
         A simple, conservative agent.
     """
 
-    def __init__(self, base_url=None):
-        super(ConservativeCrawlingAgent, self).__init__(base_url)
+    def __init__(self, base_url=None, game_manager=None):
+        super(ConservativeCrawlingAgent, self).__init__(base_url, game_manager)
         self.nickname = "Porevit"
 
     @staticmethod
-    def determine_action(game_state):
+    def determine_action(game_state, rng=None):
+        """
+            rng: random.Random making the agent's random choices, the random module by default
+            return: action_id(int)
+        """
+        rng = rng if rng is not None else random
         agent_nickname = game_state["cp_nickname"]
         matching_hands = [hand for hand in game_state.get("hands", []) if hand.get("nickname") == agent_nickname]
         if len(matching_hands) != 1:
@@ -42,8 +48,8 @@ class ConservativeCrawlingAgent(agent.Agent):
         if not players or not others_card_num:
             raise ValueError("Can't get my hand or other player's card numbers from the game state.")
 
-        bet_probs = handler.Handler().get_probability_vector(hand, others_card_num)
-        bet_probs_generic = handler.Handler().get_probability_vector([], total_card_num)
+        bet_probs = handler.get_shared_handler().get_probability_vector(hand, others_card_num)
+        bet_probs_generic = handler.get_shared_handler().get_probability_vector([], total_card_num)
         last_bet = None
         if game_state.get("history"):
             last_bet = game_state.get("history")[-1]["action_id"]
@@ -66,42 +72,33 @@ class ConservativeCrawlingAgent(agent.Agent):
             if sum(check_vs_bet_probs) == 0:
                 return 88
 
-            check = random.choices([True, False], weights=normalise(check_vs_bet_probs), k=1)[0]
+            check = rng.choices([True, False], weights=normalise(check_vs_bet_probs), k=1)[0]
             if check:
                 return 88
 
         sampling_weights = compute_sampling_weights(bet_probs, bet_probs_generic)
-        sampled_action = random.choices(range(len(sampling_weights)), weights=sampling_weights, k=1)[0]
+        sampled_action = rng.choices(range(len(sampling_weights)), weights=sampling_weights, k=1)[0]
 
         return sampled_action
 
-    def run(self):
+    def run(self, long_poll=None):
         """
             Play the game.
+            long_poll: seconds the engine may hold each game state fetch, see StateWatcher
         """
         if not self.joined_game:
             print("I have not joined any game yet")
             return
-        done = False
-        while not done:
-            succeeded, game_state = self.game_manager.get_game_state()
-            if not succeeded:
-                print("Can't get the game state.")
-                continue
-
+        watcher = StateWatcher(self.game_manager, self.nickname, long_poll=long_poll)
+        while True:
+            game_state = watcher.wait_for_turn()
             if game_state.get("status") != "Running":
-                if game_state.get("status") == "Not started":
-                    print("Game not yet started")
-                else:
-                    print("Game finished")
-                    break
-                continue
-
-            if game_state.get("cp_nickname") != self.nickname:
-                continue
-
-            sampled_action = determine_action(game_state, self.nickname)
-            self.game_manager.play(sampled_action)
+                print("Game finished")
+                break
+
+            sampled_action = determine_action(game_state)
+            if not self.game_manager.play(sampled_action):
+                watcher.forget_turn()
 
 
 # Expose determine_action for import
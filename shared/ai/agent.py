@@ -1,18 +1,25 @@
-from shared.api import game_manager
+from shared.api.game_manager import GameManager
+from shared.api.state_watcher import StateWatcher
 from shared.probabilities import handler
 
 
 class Agent(object):
-    """Base/parent class for AI agents to play Blef."""
+    """
+        Base/parent class for AI agents to play Blef.
+        Pass an async_game_manager.AsyncGameManager as game_manager
+        to play with the coroutines join_game_async / start_game_async / run_async.
+    """
 
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, game_manager=None):
         super(Agent, self).__init__()
         self.nickname = "Anonymous Intelligence"  # Overwrite this in a child class
-        if base_url is not None:
-            self.game_manager = game_manager.GameManager(base_url)
+        if game_manager is not None:
+            self.game_manager = game_manager
+        elif base_url is not None:
+            self.game_manager = GameManager(base_url)
         else:
-            self.game_manager = game_manager.GameManager()
-        self.prob_handler = handler.Handler()
+            self.game_manager = GameManager()
+        self.prob_handler = handler.get_shared_handler()
         self.joined_game = False
 
     def join_game(self, game_uuid, nickname=None, run=True):
@@ -40,3 +47,33 @@ class Agent(object):
         """
         print("There's no gameplay logic implemented in the AI agent!")
         return False
+
+    async def join_game_async(self, game_uuid, nickname=None):
+        """
+            asyncio version of join_game, which doesn't start playing
+            return: succeeded(bool)
+        """
+        if isinstance(nickname, str) and len(nickname) > 0:
+            self.nickname = nickname
+        succeeded, _ = await self.game_manager.join_game(game_uuid, self.nickname)
+        self.joined_game = succeeded
+        return succeeded
+
+    async def start_game_async(self):
+        return await self.game_manager.start_game()
+
+    async def run_async(self, long_poll=None):
+        """
+            asyncio version of run: play the game, watching the game state with StateWatcher
+            return: whether the game was played until it finished(bool)
+        """
+        if not self.joined_game:
+            print("I have not joined any game yet")
+            return False
+        watcher = StateWatcher(self.game_manager, self.nickname, long_poll=long_poll)
+        while True:
+            game_state = await watcher.wait_for_turn_async()
+            if game_state.get("status") != "Running":
+                return True
+            if not await self.game_manager.play(self.determine_action(game_state)):
+                watcher.forget_turn()
@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import subprocess
+from os import path
+from statistics import median
+from shared.probabilities import probability_table as pt
+
+
+REPO_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+
+# Run in a fresh interpreter, to measure a cold start of an agent process
+STARTUP_SCRIPT = """
+import json
+from time import perf_counter
+t0 = perf_counter()
+from conservative_ai.agent import ConservativeAgent
+import shared.api.simpleschema_local_manager as game_manager
+t1 = perf_counter()
+game = game_manager.create_game(2).to_dict()
+t2 = perf_counter()
+ConservativeAgent.determine_action(game)
+t3 = perf_counter()
+ConservativeAgent.determine_action(game)
+t4 = perf_counter()
+print(json.dumps({"import": t1 - t0, "first_decision": t3 - t2, "second_decision": t4 - t3, "import_to_first_decision": t3 - t0 - (t2 - t1)}))
+"""
+
+
+def measure_startup(n_runs=10, cold=False):
+    """
+        Measure the time from importing an agent to its first decision,
+        each run in a new Python process.
+        cold=True removes the memory-mapped table export before every run
+        return: timings in seconds(dict of {measure: {"min", "median", "max"}})
+    """
+    runs = []
+    for _ in range(n_runs):
+        if cold and path.exists(pt.MMAP_FILENAME):
+            os.remove(pt.MMAP_FILENAME)
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=REPO_DIR, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {measure: {"min": min(run[measure] for run in runs),
+                      "median": median(run[measure] for run in runs),
+                      "max": max(run[measure] for run in runs)}
+            for measure in runs[0]}
+
+
+if __name__ == "__main__":
+    """ Run script manually - print startup timings for warm and cold table loads """
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(json.dumps({"warm": measure_startup(n_runs), "cold": measure_startup(n_runs, cold=True)}, indent=2))
@@ -0,0 +1,227 @@
+"""
+    Load test of the networked agent pipeline: n_games concurrent games of n_agents
+    ConservativeAgents each, played against an engine at base_url through
+    instrumented game managers. The JSON report has latency percentiles per
+    endpoint, requests per second, errors, retries and the agents' time per decision.
+    Run: python -m shared.ai.load_test [base_url|local] [n_games] [n_agents] [async|threads] [report.json]
+"""
+import sys
+import json
+import asyncio
+import threading
+from time import monotonic
+import numpy as np
+from shared.api.game_manager import GameManager, create_http
+from shared.api.async_game_manager import AsyncGameManager, AsyncConnectionPool
+from shared.ai.orchestrator import Orchestrator
+from conservative_ai.agent import ConservativeAgent
+
+
+ENDPOINTS = ("games", "create", "join", "start", "play", "state")
+
+
+def endpoint_name(url, base_url):
+    """
+        return: the endpoint of a Game Engine Service URL(str), one of ENDPOINTS
+    """
+    parts = url[len(base_url):].split("?")[0].strip("/").split("/")
+    if len(parts) == 1:
+        return "games"
+    if parts[1] == "create":
+        return "create"
+    return parts[2] if len(parts) > 2 else "state"
+
+
+def summarise(values):
+    """
+        return: count, mean and p50/p95/p99 of values in milliseconds(dict)
+    """
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {"count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(p50),
+            "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(values.max())}
+
+
+class LoadMetrics(object):
+    """Thread-safe collection of request and decision timings."""
+
+    def __init__(self):
+        super(LoadMetrics, self).__init__()
+        self.lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.statuses = {}
+        self.decisions = []
+        self.game_managers = []
+
+    def add_game_manager(self, game_manager):
+        with self.lock:
+            self.game_managers.append(game_manager)
+
+    def record_request(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            # 304 answers a long poll which timed out
+            if status is None or (status >= 400 and status != 429):
+                self.errors[endpoint] += 1
+            key = str(status) if status is not None else "failed"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def record_decision(self, seconds):
+        with self.lock:
+            self.decisions.append(seconds)
+
+    def report(self, duration, pool=None):
+        """
+            return: report(dict)
+        """
+        n_requests = sum(len(latencies) for latencies in self.latencies.values())
+        retries = sum(getattr(game_manager, "n_retries", 0) for game_manager in self.game_managers)
+        if pool is not None:
+            retries += pool.n_retries
+        return {
+            "duration_s": duration,
+            "requests": n_requests,
+            "requests_per_second": n_requests / duration if duration else 0.0,
+            "errors": sum(self.errors.values()),
+            "retries": retries,
+            "throttled": sum(game_manager.n_throttled for game_manager in self.game_managers),
+            "statuses": self.statuses,
+            "endpoints": {endpoint: dict(summarise(self.latencies[endpoint]), errors=self.errors[endpoint])
+                          for endpoint in ENDPOINTS if self.latencies[endpoint]},
+            "decisions": summarise(self.decisions)
+        }
+
+
+class InstrumentedGameManager(GameManager):
+    """
+        GameManager recording the latency of every call into metrics, and the time
+        between fetching a game state and playing - the agent's decision time
+    """
+
+    def __init__(self, base_url, metrics, **kwargs):
+        self.metrics = metrics
+        self.fetched = None
+        super(InstrumentedGameManager, self).__init__(base_url, **kwargs)
+        metrics.add_game_manager(self)
+
+    def request(self, url, retries=None, timeout=None):
+        t0 = monotonic()
+        status, data = super(InstrumentedGameManager, self).request(url, retries=retries, timeout=timeout)
+        self.metrics.record_request(endpoint_name(url, self.base_url), monotonic() - t0, status)
+        return status, data
+
+    def get_game_state(self, *args, **kwargs):
+        result = super(InstrumentedGameManager, self).get_game_state(*args, **kwargs)
+        self.fetched = monotonic()
+        return result
+
+    def play(self, *args, **kwargs):
+        if self.fetched is not None:
+            self.metrics.record_decision(monotonic() - self.fetched)
+        return super(InstrumentedGameManager, self).play(*args, **kwargs)
+
+
+class InstrumentedAsyncGameManager(AsyncGameManager):
+    """asyncio version of InstrumentedGameManager."""
+
+    def __init__(self, base_url, metrics, **kwargs):
+        super(InstrumentedAsyncGameManager, self).__init__(base_url, **kwargs)
+        self.metrics = metrics
+        self.fetched = None
+        metrics.add_game_manager(self)
+
+    async def request(self, url, idempotent=True):
+        t0 = monotonic()
+        status, data = await super(InstrumentedAsyncGameManager, self).request(url, idempotent=idempotent)
+        self.metrics.record_request(endpoint_name(url, self.base_url), monotonic() - t0, status)
+        return status, data
+
+    async def get_game_state(self, *args, **kwargs):
+        result = await super(InstrumentedAsyncGameManager, self).get_game_state(*args, **kwargs)
+        self.fetched = monotonic()
+        return result
+
+    async def play(self, *args, **kwargs):
+        if self.fetched is not None:
+            self.metrics.record_decision(monotonic() - self.fetched)
+        return await super(InstrumentedAsyncGameManager, self).play(*args, **kwargs)
+
+
+def play_threaded_game(base_url, n_agents, metrics, long_poll=None, http=None):
+    """
+        Play a game with GameManager, each agent running in its own thread
+        return: succeeded(bool)
+    """
+    succeeded, game_uuid = InstrumentedGameManager(base_url, metrics, http=http).create_game()
+    if not succeeded:
+        return False
+    agents = [ConservativeAgent(game_manager=InstrumentedGameManager(base_url, metrics, http=http)) for i in range(n_agents)]
+    for i, agent in enumerate(agents):
+        agent.join_game(game_uuid, "admin_bot" if i == 0 else "bot_{}".format(i - 1), run=False)
+    if not agents[0].start_game():
+        return False
+    threads = [threading.Thread(target=agent.run, kwargs={"long_poll": long_poll}) for agent in agents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return True
+
+
+def run_load_test(base_url, n_games=10, n_agents=4, mode="async", long_poll=None, pool_size=None):
+    """
+        Play n_games games of n_agents agents at once against base_url
+        mode: "async" - all agents in one event loop (Orchestrator.orchestrate_games_async),
+              "threads" - GameManager, with a thread per agent
+        pool_size: connections per host, by default one per agent
+        return: report(dict)
+    """
+    metrics = LoadMetrics()
+    pool_size = pool_size if pool_size is not None else n_games * n_agents
+    pool = None
+    t0 = monotonic()
+    if mode == "async":
+        pool = AsyncConnectionPool(maxsize=pool_size)
+        orchestrator = Orchestrator(base_url)
+
+        async def play_games():
+            async with pool:
+                return await orchestrator.orchestrate_games_async(
+                    n_games, n_agents, long_poll, make_game_manager=lambda: InstrumentedAsyncGameManager(base_url, metrics, pool=pool))
+        finished = asyncio.run(play_games())
+    elif mode == "threads":
+        http = create_http(maxsize=pool_size)
+        results = []
+        games = [threading.Thread(target=lambda: results.append(play_threaded_game(base_url, n_agents, metrics, long_poll, http)))
+                 for i in range(n_games)]
+        for game in games:
+            game.start()
+        for game in games:
+            game.join()
+        finished = sum(results)
+    else:
+        raise ValueError("Unknown mode: {}".format(mode))
+    report = metrics.report(monotonic() - t0, pool=pool)
+    report["config"] = {"base_url": base_url, "n_games": n_games, "n_agents": n_agents,
+                        "mode": mode, "long_poll": long_poll, "pool_size": pool_size}
+    report["games_finished"] = finished
+    return report
+
+
+if __name__ == "__main__":
+    """ Run script manually - print or save the report of a load test """
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "local"
+    if base_url == "local":
+        from shared.api.local_server import LocalServer
+        base_url = LocalServer(port=0).start()
+    report = run_load_test(base_url,
+                           n_games=int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+                           n_agents=int(sys.argv[3]) if len(sys.argv) > 3 else 4,
+                           mode=sys.argv[4] if len(sys.argv) > 4 else "async")
+    if len(sys.argv) > 5:
+        with open(sys.argv[5], "w") as filehandle:
+            json.dump(report, filehandle, indent=2)
+    print(json.dumps(report, indent=2))
@@ -1,7 +1,9 @@
 import random
+import asyncio
 from time import sleep
 from multiprocessing import Process
 from shared.api.game_manager import GameManager
+from shared.api.async_game_manager import AsyncGameManager, close_shared_pool
 from conservative_ai.agent import ConservativeAgent
 
 
@@ -61,3 +63,47 @@ class Orchestrator(object):
             else:
                 done = True
         print("All agents finished the game")
+
+    async def orchestrate_single_game_async(self, n_agents=2, long_poll=None, make_game_manager=None):
+        """
+            Play a game between n_agents agents in the running event loop
+            make_game_manager: callable creating the AsyncGameManager of the game and of each agent
+            return: succeeded(bool)
+        """
+        if make_game_manager is None:
+            make_game_manager = lambda: AsyncGameManager(self.base_url)
+        succeeded, game_uuid = await make_game_manager().create_game()
+        if not succeeded:
+            return False
+        admin_agent = ConservativeAgent(game_manager=make_game_manager())
+        nonadmin_agents = [ConservativeAgent(game_manager=make_game_manager()) for i in range(n_agents - 1)]
+        await admin_agent.join_game_async(game_uuid, "admin_bot")
+        for i, agent in enumerate(nonadmin_agents):
+            await agent.join_game_async(game_uuid, "bot_{}".format(i))
+        if not await admin_agent.start_game_async():
+            return False
+        agents = nonadmin_agents + [admin_agent]
+        return all(await asyncio.gather(*(agent.run_async(long_poll) for agent in agents)))
+
+    async def orchestrate_games_async(self, n_games=1, n_agents=2, long_poll=None, make_game_manager=None):
+        """
+            Play n_games games at once, with all agents sharing the running
+            event loop and its connection pool - close it before the loop ends
+            with async_game_manager.close_shared_pool (see play_games_async)
+            return: number of games played until they finished(int)
+        """
+        results = await asyncio.gather(*(self.orchestrate_single_game_async(n_agents, long_poll, make_game_manager) for i in range(n_games)))
+        print("All agents finished {} games".format(sum(results)))
+        return sum(results)
+
+    def play_games_async(self, n_games=1, n_agents=2, long_poll=None):
+        """
+            Run orchestrate_games_async in a new event loop
+            return: number of games played until they finished(int)
+        """
+        async def play_games():
+            try:
+                return await self.orchestrate_games_async(n_games, n_agents, long_poll)
+            finally:
+                await close_shared_pool()
+        return asyncio.run(play_games())
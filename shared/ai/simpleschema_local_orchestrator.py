@@ -1,23 +1,150 @@
-from multiprocessing import Process
-from copy import deepcopy
+import random
+from multiprocessing import Pool
 import shared.api.simpleschema_local_manager as game_manager
+from shared.api.batched_local_manager import BatchedGames
+from shared.api.persistence import Persistence, FilePersistence
 from conservative_ai.agent import ConservativeAgent
 from time import time
+import numpy as np
 
 
-def run_game(n_agents, verbose=False):
-    game = game_manager.create_game(n_agents, verbose=verbose)
-    while game.get("cp_nickname"):
+def derive_seeds(seed, n_games):
+    """
+        Derive an independent, deterministic seed for each game from one seed
+        return: seeds(list of int)
+    """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_games)]
+
+
+def run_game(n_agents, verbose=False, seed=None):
+    """
+        Play a game between n_agents agents
+        seed: seeds the random choices of the game (deals and agents)
+        return: result(dict) - winner, rounds, round of elimination per agent and timings
+    """
+    # The game's own generator, so that the caller's random state is left alone
+    rng = random.Random(seed)
+    t0 = time()
+    agent_time = 0.0
+    engine_time = 0.0
+    game = game_manager.create_game(n_agents, verbose=verbose, seed=seed)
+    eliminations = {}
+    while game.cp is not None:
         t1 = time()
-        action = ConservativeAgent.determine_action(game)
+        # The agent reads the JSON schema - building it is part of its decision
+        game_state = game.to_dict()
+        action = ConservativeAgent.determine_action(game_state, rng=rng)
         t2 = time()
+        round_number = game.round_number
         game_manager.play(game, action, verbose=verbose)
         t3 = time()
+        agent_time += t2 - t1
+        engine_time += t3 - t2
         if verbose:
             print(f"Agent: {t2-t1}; engine: {t3-t2}")
-    print("Game finished")
+        if action == game_manager.CHECK:
+            for player, n_cards in enumerate(game.n_cards):
+                if n_cards == 0 and game.nicknames[player] not in eliminations:
+                    eliminations[game.nicknames[player]] = round_number
+    if verbose:
+        print("Game finished")
+    return {
+        "game_uuid": game.game_uuid,
+        "seed": seed,
+        "winner": next(nickname for nickname, n_cards in zip(game.nicknames, game.n_cards) if n_cards > 0),
+        "rounds": game.round_number - 1,
+        "eliminations": eliminations,
+        "agent_time": agent_time,
+        "engine_time": engine_time,
+        "duration": time() - t0
+    }
+
+
+def init_worker(persistence_factory):
+    # A backend inherited from the parent has lost its writer thread in the fork
+    game_manager.set_persistence(persistence_factory() if persistence_factory is not None else FilePersistence("games"))
+
+
+def run_worker_game(args):
+    n_agents, seed = args
+    result = run_game(n_agents, seed=seed)
+    # Pool workers exit without running atexit handlers - write the saves now
+    game_manager.get_persistence().flush()
+    return result
+
+
+def aggregate_results(results):
+    """
+        Merge results of run_game into a summary
+        return: summary(dict)
+    """
+    summary = {"n_games": 0, "rounds": 0, "wins": {}, "eliminations": {}, "agent_time": 0.0, "engine_time": 0.0}
+    for result in results:
+        summary["n_games"] += 1
+        summary["rounds"] += result["rounds"]
+        summary["wins"][result["winner"]] = summary["wins"].get(result["winner"], 0) + 1
+        for nickname in result["eliminations"]:
+            summary["eliminations"][nickname] = summary["eliminations"].get(nickname, 0) + 1
+        summary["agent_time"] += result["agent_time"]
+        summary["engine_time"] += result["engine_time"]
+    summary["mean_rounds"] = summary["rounds"] / summary["n_games"] if summary["n_games"] else 0.0
+    return summary
+
+
+def run_games(n_games, n_agents, verbose=False, persistence=None, processes=1, seed=None, on_result=None):
+    """
+        Play n_games games between n_agents agents, on a pool of processes if processes > 1.
+        persistence: backend saving the game states (see shared.api.persistence),
+                     by default one file per game state under games/.
+                     With processes > 1 pass a picklable callable creating the backend
+                     (e.g. persistence.DisabledPersistence), called in every worker.
+        seed: every game gets a seed derived from it, so results are reproducible
+              regardless of the number of processes
+        on_result: callable receiving each game's result as it finishes
+        return: summary(dict), see aggregate_results
+    """
+    seeds = derive_seeds(seed, n_games) if seed is not None else [None] * n_games
+    t0 = time()
+    results = []
+    if processes > 1:
+        if isinstance(persistence, Persistence):
+            raise TypeError("With processes > 1, persistence must be a callable creating the backend")
+        with Pool(processes, initializer=init_worker, initargs=(persistence,)) as pool:
+            for result in pool.imap_unordered(run_worker_game, [(n_agents, game_seed) for game_seed in seeds]):
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    else:
+        previous = None
+        if persistence is not None:
+            previous = game_manager.set_persistence(persistence if isinstance(persistence, Persistence) else persistence())
+        try:
+            for game_seed in seeds:
+                result = run_game(n_agents, verbose=verbose, seed=game_seed)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+            game_manager.get_persistence().flush()
+        finally:
+            if persistence is not None:
+                game_manager.set_persistence(previous)
+    summary = aggregate_results(results)
+    summary["duration"] = time() - t0
+    print("Finished {} games in {:.2f}s".format(summary["n_games"], summary["duration"]))
+    return summary
 
 
-def run_games(n_games, n_agents, verbose=False):
-    for _ in range(n_games):
-        run_game(n_agents, verbose=verbose)
+def run_batched_games(n_games, n_agents, seed=None):
+    """
+        Play n_games games between n_agents agents in lockstep
+        return: winner index of each game(np.ndarray), rounds of each game(np.ndarray)
+    """
+    games = BatchedGames(n_games, n_agents, seed=seed)
+    while not games.done:
+        hand_masks, others_card_nums, last_bets = games.observe()
+        running = ~games.finished
+        actions = np.full(n_games, game_manager.CHECK)
+        actions[running] = ConservativeAgent.determine_actions(hand_masks[running], others_card_nums[running],
+                                                               last_bets[running], rng=games.rng)
+        games.step(actions)
+    return games.winners, games.round_number - 1
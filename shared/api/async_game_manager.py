@@ -0,0 +1,280 @@
+import asyncio
+import weakref
+from urllib3.util import parse_url
+from shared.api.game_manager import BaseGameManager, THROTTLED_RETRIES
+from shared.api.rate_limit import get_rate_limiter, parse_retry_after
+
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAXSIZE = 100
+# Largest response body read, in bytes - game states are a few kB
+MAX_RESPONSE_SIZE = 16 * 1024 * 1024
+
+# Connection pools of the running event loops, see get_shared_pool
+_pools = weakref.WeakKeyDictionary()
+
+
+class AsyncConnectionPool(object):
+    """
+        asyncio pool of keep-alive HTTP/1.1 connections for the GET requests
+        of the Game Engine Service API. It only implements what the engine's
+        API needs - GET, Content-Length or chunked JSON bodies, no proxies -
+        so that the async agents need nothing beyond the standard library and urllib3.
+        maxsize: number of connections open at once per host, further requests wait
+        timeout: seconds allowed for connecting and for each response
+        retries: times a request is repeated after a connection error,
+                 on a new connection, if it is safe to repeat
+        ssl: ssl.SSLContext for https engines, by default one verifying
+             certificates against the system's CAs
+        max_response_size: largest response body accepted, in bytes
+        Close the pool with aclose, or use it as an async context manager.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, timeout=DEFAULT_TIMEOUT, retries=2, ssl=None,
+                 max_response_size=MAX_RESPONSE_SIZE):
+        super(AsyncConnectionPool, self).__init__()
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.ssl = ssl
+        self.max_response_size = max_response_size
+        # Requests repeated after connection errors
+        self.n_retries = 0
+        # (scheme, host, port) -> idle (reader, writer) pairs
+        self.idle = {}
+        self.semaphores = {}
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def request(self, url, idempotent=True):
+        """
+            GET url
+            idempotent: whether the request may be repeated after the server could have received it
+            return: status(int), headers(dict, lowercase names), data(bytes)
+            raises: OSError, asyncio.TimeoutError, ValueError on connection or protocol errors
+        """
+        url = parse_url(url)
+        key = (url.scheme or "http", url.host, url.port or (443 if url.scheme == "https" else 80))
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(self.maxsize)
+            self.idle[key] = []
+        request = "GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\n\r\n".format(
+            url.request_uri, url.netloc).encode("latin-1")
+        async with self.semaphores[key]:
+            for attempt in range(self.retries + 1):
+                if self.closed:
+                    raise ConnectionError("The connection pool is closed")
+                reused = bool(self.idle[key])
+                writer = None
+                try:
+                    if reused:
+                        reader, writer = self.idle[key].pop()
+                    else:
+                        ssl = (self.ssl or True) if key[0] == "https" else None
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(key[1], key[2], ssl=ssl), self.timeout)
+                    writer.write(request)
+                    status, headers, data, keep_alive = await asyncio.wait_for(self.read_response(reader), self.timeout)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as err:
+                    if writer is not None:
+                        writer.close()
+                    # An idle connection closed by the server fails before any response,
+                    # and the request was not received - repeating it is always safe
+                    stale = reused and isinstance(err, (ConnectionResetError, BrokenPipeError))
+                    if attempt == self.retries or not (idempotent or stale):
+                        raise
+                    self.n_retries += 1
+                    continue
+                except BaseException:
+                    # Cancelled (e.g. by an outer timeout) - the connection is mid-request
+                    if writer is not None:
+                        writer.close()
+                    raise
+                if keep_alive and not self.closed:
+                    self.idle[key].append((reader, writer))
+                else:
+                    writer.close()
+                return status, headers, data
+
+    async def read_response(self, reader):
+        """
+            return: status(int), headers(dict), data(bytes), keep_alive(bool)
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        version, status = status_line.split(None, 2)[:2]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = True
+        if 100 <= status < 200 or status in (204, 304):
+            # Never have a body, whatever the headers (RFC 9112, section 6.3)
+            data = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            received = 0
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Skip the trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                received += size
+                if received > self.max_response_size:
+                    raise ValueError("The response is larger than {} bytes".format(self.max_response_size))
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in headers:
+            if int(headers["content-length"]) > self.max_response_size:
+                raise ValueError("The response is larger than {} bytes".format(self.max_response_size))
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read(self.max_response_size + 1)
+            if len(data) > self.max_response_size:
+                raise ValueError("The response is larger than {} bytes".format(self.max_response_size))
+            keep_alive = False
+        connection = headers.get("connection", "").lower()
+        keep_alive = keep_alive and connection != "close" and (version != b"HTTP/1.0" or connection == "keep-alive")
+        return status, headers, data, keep_alive
+
+    async def aclose(self):
+        """
+            Close the idle connections, and the ones in use once their requests end
+        """
+        self.closed = True
+        writers = [writer for connections in self.idle.values() for _, writer in connections]
+        for connections in self.idle.values():
+            del connections[:]
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def get_shared_pool():
+    """
+        Get the connection pool shared by the AsyncGameManagers of the running event loop,
+        closed with close_shared_pool
+        return: pool(AsyncConnectionPool)
+    """
+    loop = asyncio.get_event_loop()
+    if loop not in _pools or _pools[loop].closed:
+        _pools[loop] = AsyncConnectionPool()
+    return _pools[loop]
+
+
+async def close_shared_pool():
+    """
+        Close the connection pool shared in the running event loop, if any -
+        await it before the loop ends, e.g. in a finally of the coroutine given to asyncio.run
+    """
+    pool = _pools.pop(asyncio.get_event_loop(), None)
+    if pool is not None:
+        await pool.aclose()
+
+
+class AsyncGameManager(BaseGameManager):
+    """
+        asyncio manager of API calls to the Blef Game Engine Service,
+        with the same methods as GameManager, as coroutines.
+        Requests go through pool, by default the one shared by the running
+        event loop, and are paced by the rate limiter of the engine host,
+        whose limit rate and burst set if given (see GameManager).
+    """
+
+    def __init__(self, base_url="http://localhost:8002/v2.1/", pool=None, rate_limiter=None, rate=None, burst=None):
+        super(AsyncGameManager, self).__init__(base_url)
+        self.pool = pool
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter(base_url, rate, burst)
+        self.last_error = None
+        # Requests repeated after 429 responses
+        self.n_throttled = 0
+
+    async def test_connection(self):
+        """
+            Test whether it's possible to reach a valid
+            Game Engine Service at self.base_url
+        """
+        status, _ = await self.request(self.base_url + "games")
+        if status is None:
+            raise ConnectionError("Can't reach a game engine at base_url: {}".format(self.last_error))
+        if status != 200:
+            raise ConnectionError("base_url is not a valid base path of a running game engine")
+
+    async def request(self, url, idempotent=True):
+        """
+            GET url within the rate limit.
+            Long polls (see get_game_state) must wait less than the pool's timeout.
+            Throttled (429) requests are repeated after the time the engine asks for.
+            return: status(int, None if the request failed), data(bytes)
+        """
+        pool = self.pool if self.pool is not None else get_shared_pool()
+        for _ in range(THROTTLED_RETRIES + 1):
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                status, headers, data = await pool.request(url, idempotent=idempotent)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as err:
+                self.last_error = err
+                return None, None
+            if status != 429:
+                break
+            self.n_throttled += 1
+            self.rate_limiter.throttled(parse_retry_after(headers.get("retry-after")))
+        return status, data
+
+    async def create_game(self):
+        """
+            Call the Game Engine Service /create endpoint
+            return: succeeded(bool), game_uuid(uuid.UUID)
+        """
+        return self.parse_create_game(*await self.request(self.create_game_url(), idempotent=False))
+
+    async def join_game(self, game_uuid, nickname):
+        """
+            Call the Game Engine Service /games/{id}/join endpoint
+            store uuids in the object.
+            return: succeeded(bool), player_uuid(uuid.UUID)
+        """
+        url = self.join_game_url(game_uuid, nickname)
+        return self.parse_join_game(game_uuid, *await self.request(url, idempotent=False))
+
+    async def start_game(self, game_uuid=None, player_uuid=None):
+        """
+            Call the Game Engine Service /games/{id}/start endpoint
+            return: succeeded(bool)
+        """
+        url = self.start_game_url(game_uuid, player_uuid)
+        return self.parse_start_game(*await self.request(url, idempotent=False))
+
+    async def play(self, action_id, game_uuid=None, player_uuid=None):
+        """
+            Call the Game Engine Service /games/{id}/play endpoint
+            return: succeeded(bool)
+        """
+        return self.parse_play(*await self.request(self.play_url(action_id, game_uuid, player_uuid), idempotent=False))
+
+    async def get_game_state(self, game_uuid=None, player_uuid=None, version=None, wait=None):
+        """
+            Call the Game Engine Service /games/{id} endpoint,
+            long polling if version is given (see BaseGameManager.game_state_url)
+            return: succeeded(bool), game_state(dict, None if the state didn't change)
+        """
+        return self.parse_game_state(*await self.request(self.game_state_url(game_uuid, player_uuid, version, wait)))
@@ -0,0 +1,127 @@
+from math import floor
+import numpy as np
+from shared.api.dealing import N_CARDS, draw_permutations, permutations_to_hand_masks
+from shared.api.simpleschema_local_manager import CHECK, set_exists_batch
+
+
+NO_BET = -1
+
+
+class BatchedGames(object):
+    """
+        Many independent games of the local simpleschema engine, played in lockstep.
+        The state of all games is stored in NumPy arrays (one row per game):
+            n_cards      (n_games, n_players) - card numbers, 0 for eliminated players
+            hand_masks   (n_games, n_players) - hands as 24-bit card masks
+            cp           (n_games,) - index of the current player
+            last_bet     (n_games,) - last action_id of the round, or NO_BET
+            last_bettor  (n_games,) - index of the player who made last_bet
+            round_number (n_games,)
+            finished     (n_games,)
+        Every step takes one action per game, for the current player of each game.
+    """
+
+    def __init__(self, n_games, n_players, seed=None):
+        super(BatchedGames, self).__init__()
+        if n_players < 2:
+            raise ValueError("n_players < 2")
+        self.n_games = n_games
+        self.n_players = n_players
+        self.max_cards = floor(N_CARDS / n_players) if n_players > 2 else 11
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(n_games)
+        self.reset()
+
+    def reset(self):
+        self.n_cards = np.ones((self.n_games, self.n_players), dtype=np.int8)
+        self.hand_masks = np.zeros((self.n_games, self.n_players), dtype=np.int64)
+        self.cp = np.zeros(self.n_games, dtype=np.intp)
+        self.last_bet = np.full(self.n_games, NO_BET, dtype=np.intp)
+        self.last_bettor = np.zeros(self.n_games, dtype=np.intp)
+        self.round_number = np.ones(self.n_games, dtype=np.int32)
+        self.finished = np.zeros(self.n_games, dtype=bool)
+        self.deal(self.games)
+
+    @property
+    def done(self):
+        return bool(self.finished.all())
+
+    @property
+    def winners(self):
+        """
+            return: index of the winner of each finished game, -1 for running games(np.ndarray)
+        """
+        return np.where(self.finished, (self.n_cards > 0).argmax(axis=1), -1)
+
+    def deal(self, games):
+        """
+            Deal new hands in the given games: each game draws a random
+            permutation of the deck and players take consecutive cards from it
+        """
+        if not len(games):
+            return
+        permutations = draw_permutations(self.rng, len(games))
+        self.hand_masks[games] = permutations_to_hand_masks(permutations, self.n_cards[games])
+
+    def next_active_player(self, games, players):
+        """
+            return: the next player with cards after each of players in games(np.ndarray)
+        """
+        candidates = (players[:, None] + 1 + np.arange(self.n_players)) % self.n_players
+        has_cards = self.n_cards[games[:, None], candidates] > 0
+        return candidates[np.arange(len(games)), has_cards.argmax(axis=1)]
+
+    def observe(self):
+        """
+            The current player's view of every game
+            return: hand_masks(np.ndarray of shape (n_games,)) - the current player's hands,
+                    others_card_nums(np.ndarray of shape (n_games,)),
+                    last_bets(np.ndarray of shape (n_games,)) - NO_BET if the round just started
+        """
+        hand_masks = self.hand_masks[self.games, self.cp]
+        others_card_nums = self.n_cards.sum(axis=1, dtype=np.intp) - self.n_cards[self.games, self.cp]
+        return hand_masks, others_card_nums, self.last_bet.copy()
+
+    def step(self, actions):
+        """
+            Play one action (0-87 to bet, 88 to check) in every running game.
+            Actions of finished games are ignored.
+        """
+        actions = np.asarray(actions, dtype=np.intp).reshape(-1)
+        if len(actions) != self.n_games:
+            raise ValueError("Expected {} actions, got {}".format(self.n_games, len(actions)))
+        running = ~self.finished
+        checks = running & (actions == CHECK)
+        bets = running & ~checks
+        invalid = (bets & ((actions <= self.last_bet) | (actions >= CHECK) | (actions < 0))) | (checks & (self.last_bet == NO_BET))
+        if invalid.any():
+            raise ValueError("Invalid actions in games: {}".format(np.flatnonzero(invalid)[:10].tolist()))
+
+        games = np.flatnonzero(bets)
+        self.last_bet[games] = actions[games]
+        self.last_bettor[games] = self.cp[games]
+        self.cp[games] = self.next_active_player(games, self.cp[games])
+
+        games = np.flatnonzero(checks)
+        if len(games):
+            self.handle_checks(games)
+
+    def handle_checks(self, games):
+        checking_players = self.cp[games]
+        deal_masks = np.bitwise_or.reduce(self.hand_masks[games], axis=1)
+        set_exists = set_exists_batch(deal_masks, self.last_bet[games])
+        losing_players = np.where(set_exists, checking_players, self.last_bettor[games])
+
+        self.n_cards[games, losing_players] += 1
+        eliminated = self.n_cards[games, losing_players] > self.max_cards
+        self.n_cards[games[eliminated], losing_players[eliminated]] = 0
+        self.finished[games] = (self.n_cards[games] > 0).sum(axis=1) == 1
+
+        # The loser starts the next round, unless they were eliminated:
+        # then the checking player starts, or the next player if it was them
+        next_players = self.next_active_player(games, checking_players)
+        self.cp[games] = np.where(~eliminated, losing_players,
+                                  np.where(losing_players == checking_players, next_players, checking_players))
+        self.last_bet[games] = NO_BET
+        self.round_number[games] += 1
+        self.deal(games[~self.finished[games]])
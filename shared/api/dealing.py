@@ -0,0 +1,71 @@
+import numpy as np
+from shared.probabilities.cards import N_VALUES, N_COLOURS
+
+
+N_CARDS = N_VALUES * N_COLOURS
+# The bit of every card id (4*value + colour) in a card mask
+CARD_BITS = tuple(1 << card for card in range(N_CARDS))
+
+
+def draw_permutations(rng, n):
+    """
+        Draw n random orderings of the deck at once
+        rng: np.random.Generator
+        return: permutations of card ids(np.ndarray of int8, shape (n, 24))
+    """
+    return rng.random((n, N_CARDS)).argsort(axis=1).astype(np.int8)
+
+
+def permutations_to_hand_masks(permutations, n_cards):
+    """
+        Deal from deck orderings - players take consecutive cards from the top
+        permutations: (N, 24) card ids
+        n_cards: (N, n_players) numbers of cards to deal to each player
+        return: hand_masks(np.ndarray of int64, shape (N, n_players))
+    """
+    n_cards = np.asarray(n_cards)
+    card_bits = np.int64(1) << permutations.astype(np.int64)
+    ends = np.cumsum(n_cards, axis=1)
+    starts = ends - n_cards
+    positions = np.arange(N_CARDS)
+    hand_masks = np.zeros(n_cards.shape, dtype=np.int64)
+    for player in range(n_cards.shape[1]):
+        dealt = (positions >= starts[:, player, None]) & (positions < ends[:, player, None])
+        hand_masks[:, player] = (card_bits * dealt).sum(axis=1)
+    return hand_masks
+
+
+class Dealer(object):
+    """
+        Deals the rounds of a game from its own, explicitly seeded RNG.
+        Deck orderings are drawn block_size rounds at a time.
+    """
+
+    def __init__(self, seed=None, block_size=64):
+        super(Dealer, self).__init__()
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.permutations = []
+
+    def next_permutation(self):
+        if not self.permutations:
+            # Reversed, so that pop() returns the orderings in the order they were drawn
+            self.permutations = draw_permutations(self.rng, self.block_size).tolist()[::-1]
+        return self.permutations.pop()
+
+    def deal(self, n_cards):
+        """
+            Deal random cards to players with n_cards[i] cards each
+            return: hand_masks(list of card masks)
+        """
+        permutation = self.next_permutation()
+        hand_masks = []
+        start = 0
+        for player_n_cards in n_cards:
+            hand_mask = 0
+            for card in permutation[start:start + player_n_cards]:
+                hand_mask |= CARD_BITS[card]
+            hand_masks.append(hand_mask)
+            start += player_n_cards
+        return hand_masks
@@ -0,0 +1,96 @@
+import numpy as np
+import shared.api.simpleschema_local_manager as game_manager
+
+
+N_ACTIONS = game_manager.CHECK + 1
+NO_BET = -1
+
+
+class BlefEnv(object):
+    """
+        Gym-style environment over the local simpleschema engine, played in self-play:
+        every step is taken by the current player of the game.
+        Observations are the current player's view, kept in preallocated arrays
+        which are updated in place - copy them to keep an observation:
+            player         (1,) int8 - index of the current player, -1 once the game is finished
+            hand_mask      (1,) int64 - their hand as a 24-bit card mask
+            n_cards        (n_players,) int8 - card numbers of all players, 0 for eliminated players
+            last_bet       (1,) int8 - last action_id of the round, or NO_BET
+            history        (history_length,) int8 - last actions of the round, the latest last,
+                           padded with NO_BET
+            legal_actions  (89,) bool - the current player's legal actions
+    """
+
+    def __init__(self, n_players, history_length=8):
+        super(BlefEnv, self).__init__()
+        self.n_players = n_players
+        self.history_length = history_length
+        self.game = None
+        self.observation = {
+            "player": np.zeros(1, dtype=np.int8),
+            "hand_mask": np.zeros(1, dtype=np.int64),
+            "n_cards": np.zeros(n_players, dtype=np.int8),
+            "last_bet": np.zeros(1, dtype=np.int8),
+            "history": np.zeros(history_length, dtype=np.int8),
+            "legal_actions": np.zeros(N_ACTIONS, dtype=bool)
+        }
+        self.rewards = np.zeros(n_players, dtype=np.float32)
+
+    def reset(self, seed=None):
+        """
+            Start a new game, with deals seeded by seed
+            return: observation(dict of np.ndarray)
+        """
+        self.game = game_manager.create_game(self.n_players, seed=seed)
+        self.start_round()
+        return self.observation
+
+    def start_round(self):
+        observation = self.observation
+        observation["last_bet"][0] = NO_BET
+        observation["history"][:] = NO_BET
+        observation["n_cards"][:] = self.game.n_cards
+        legal_actions = observation["legal_actions"]
+        legal_actions[:game_manager.CHECK] = self.game.cp is not None
+        legal_actions[game_manager.CHECK] = False
+        self.observe_player()
+
+    def observe_player(self):
+        cp = self.game.cp
+        self.observation["player"][0] = -1 if cp is None else cp
+        self.observation["hand_mask"][0] = 0 if cp is None else self.game.hand_masks[cp]
+
+    def step(self, action):
+        """
+            Play action as the current player
+            return: observation(dict of np.ndarray),
+                    rewards(np.ndarray of shape (n_players,)) - -1 for the loser of a round, else 0,
+                    done(bool),
+                    info(dict) - the acting player and the loser, if the action ended the round
+        """
+        observation = self.observation
+        legal_actions = observation["legal_actions"]
+        if self.game is None or not 0 <= action < N_ACTIONS or not legal_actions[action]:
+            raise ValueError("Illegal action: {}".format(action))
+        player = self.game.cp
+        game_manager.apply(self.game, action)
+        self.rewards[:] = 0.0
+        info = {"player": player, "loser": None}
+
+        if action == game_manager.CHECK:
+            # apply keeps undo records, which the environment never uses
+            _, info["loser"], _, _, _ = self.game.undo_stack[-1]
+            del self.game.undo_stack[:]
+            self.rewards[info["loser"]] = -1.0
+            self.start_round()
+        else:
+            # Only bets above the last one remain legal
+            last_bet = observation["last_bet"][0]
+            legal_actions[last_bet + 1:action + 1] = False
+            legal_actions[game_manager.CHECK] = True
+            observation["last_bet"][0] = action
+            history = observation["history"]
+            history[:-1] = history[1:]
+            history[-1] = action
+            self.observe_player()
+        return observation, self.rewards, self.game.status == "Finished", info
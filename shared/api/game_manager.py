@@ -1,47 +1,111 @@
-from time import sleep
+import os
 import urllib3
 import json
 from uuid import UUID
+from urllib.parse import urlencode
+from shared.api.rate_limit import get_rate_limiter, is_local, parse_retry_after
 
 
-class GameManager(object):
-    """Manager of API calls to the Blef Game Engine Service."""
+DEFAULT_TIMEOUT = urllib3.Timeout(connect=5.0, read=30.0)
+# Idempotent calls are retried on connection and read errors and on gateway errors.
+# 429 responses are left to GameManager.request, which tells the shared rate limiter
+DEFAULT_RETRIES = urllib3.Retry(total=3, connect=3, read=2, status=3, backoff_factor=0.5,
+                                status_forcelist=(502, 503, 504), raise_on_status=False,
+                                respect_retry_after_header=False)
+# Calls changing the game (create, join, start, play) must not be repeated
+# once the engine may have received them
+UNSAFE_RETRIES = DEFAULT_RETRIES.new(read=0, status=0)
+# Times a request is repeated after 429 Too Many Requests responses
+THROTTLED_RETRIES = 5
+# Status of a long-polled game state which didn't change, see BaseGameManager.game_state_url
+NOT_MODIFIED = 304
+
+_http = None
+_http_pid = None
+
+
+def create_http(num_pools=10, maxsize=10, block=False, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+    """
+        Create a pool of keep-alive connections for GameManager
+        num_pools: number of hosts to keep connection pools for
+        maxsize: number of connections kept open per host
+        block: whether to wait for a free connection when maxsize connections are in use
+        return: http(urllib3.PoolManager)
+    """
+    return urllib3.PoolManager(num_pools=num_pools, maxsize=maxsize, block=block, timeout=timeout, retries=retries)
+
+
+def get_shared_http():
+    """
+        Get the connection pool shared by the GameManagers of this process.
+        A forked process gets its own, as connections can't be shared between processes.
+        return: http(urllib3.PoolManager)
+    """
+    global _http, _http_pid
+    if _http is None or _http_pid != os.getpid():
+        _http = create_http()
+        _http_pid = os.getpid()
+    return _http
+
+
+class BaseGameManager(object):
+    """
+        API calls to the Blef Game Engine Service, independent of how the requests
+        are made: builds the URLs, stores and validates the uuids and parses the
+        responses, given as status(int, None if the request failed) and data(bytes).
+        See GameManager and async_game_manager.AsyncGameManager.
+    """
 
     def __init__(self, base_url="http://localhost:8002/v2.1/"):
-        super(GameManager, self).__init__()
+        super(BaseGameManager, self).__init__()
         if not isinstance(base_url, str):
             raise TypeError("base_url must be a string")
         self.base_url = base_url
         self.game_uuid = None
         self.player_uuid = None
-        self.test_connection(base_url)
-        self.playing_locally = base_url.strip("http://").startswith("localhost")
+        self.playing_locally = is_local(base_url)
 
-    @staticmethod
-    def test_connection(base_url):
+    def create_game_url(self):
+        return self.base_url + "games/create"
+
+    def join_game_url(self, game_uuid, nickname):
+        self.update_game_uuid(game_uuid)
+        return self.base_url + "games/{}/join?nickname={}".format(str(self.game_uuid), nickname)
+
+    def start_game_url(self, game_uuid=None, player_uuid=None):
+        self.update_game_uuid(game_uuid)
+        self.update_player_uuid(player_uuid)
+        return self.base_url + "games/{}/start?admin_uuid={}".format(str(self.game_uuid), str(self.player_uuid))
+
+    def play_url(self, action_id, game_uuid=None, player_uuid=None):
+        self.update_game_uuid(game_uuid)
+        self.update_player_uuid(player_uuid)
+        return self.base_url + "games/{}/play?player_uuid={}&action_id={}".format(str(self.game_uuid), str(self.player_uuid), action_id)
+
+    def game_state_url(self, game_uuid=None, player_uuid=None, version=None, wait=None):
         """
-            Test whether it's possible to reach a valid
-            Game Engine Service at self.base_url
+            version: (status, round_number, history length) of the last known game state -
+                     an engine supporting long polling holds the request for up to
+                     wait seconds until the state changes, then answers NOT_MODIFIED
         """
-        http = urllib3.PoolManager()
-        response = http.request("GET", base_url+"games")
-        if response.status_code != 200:
-            ConnectionError("base_url is not a valid base path of a running game engine")
+        self.update_game_uuid(game_uuid)
+        self.update_player_uuid(player_uuid)
+        url = self.base_url + "games/{}?player_uuid={}".format(str(self.game_uuid), str(self.player_uuid))
+        if version is not None:
+            status, round_number, history_length = version
+            url += "&" + urlencode({"status": status, "round_number": round_number,
+                                    "history_length": history_length, "wait": wait or 0})
+        return url
 
-    def create_game(self):
+    @staticmethod
+    def parse_create_game(status, data):
         """
-            Call the Game Engine Service /create endpoint
             return: succeeded(bool), game_uuid(uuid.UUID)
         """
-        if not self.playing_locally:
-            sleep(1)
-        url = self.base_url + "games/create"
         succeeded = False
         game_uuid = None
-        http = urllib3.PoolManager()
-        response = http.request("GET", url)
-        if response.status == 200:
-            json_data = json.loads(response.data)
+        if status == 200:
+            json_data = json.loads(data)
             uuid = json_data.get("game_uuid")
             if uuid:
                 try:
@@ -51,22 +115,15 @@ class GameManager(object):
                     pass
         return succeeded, game_uuid
 
-    def join_game(self, game_uuid, nickname):
+    def parse_join_game(self, game_uuid, status, data):
         """
-            Call the Game Engine Service /games/{id}/join endpoint
-            store uuids in the object.
+            Store the uuids if joining succeeded
             return: succeeded(bool), player_uuid(uuid.UUID)
         """
-        if not self.playing_locally:
-            sleep(1)
-        self.update_game_uuid(game_uuid)
-        url = self.base_url + "games/{}/join?nickname={}".format(str(self.game_uuid), nickname)
         succeeded = False
         player_uuid = None
-        http = urllib3.PoolManager()
-        response = http.request("GET", url)
-        if response.status == 200:
-            json_data = json.loads(response.data)
+        if status == 200:
+            json_data = json.loads(data)
             uuid = json_data.get("player_uuid")
             if uuid:
                 try:
@@ -78,61 +135,37 @@ class GameManager(object):
                     pass
         return succeeded, player_uuid
 
-    def start_game(self, game_uuid=None, player_uuid=None):
+    @staticmethod
+    def parse_start_game(status, data):
         """
-            Call the Game Engine Service /games/{id}/start endpoint
             return: succeeded(bool)
         """
-        if not self.playing_locally:
-            sleep(1)
-        self.update_game_uuid(game_uuid)
-        self.update_player_uuid(player_uuid)
-        url = self.base_url + "games/{}/start?admin_uuid={}".format(str(self.game_uuid), str(self.player_uuid))
         succeeded = False
-        http = urllib3.PoolManager()
-        response = http.request("GET", url)
-        if response.status == 202:
-            json_data = json.loads(response.data)
+        if status == 202:
+            json_data = json.loads(data)
             message = json_data.get("message")
             if message == "Game started":
                 succeeded = True
         return succeeded
 
-    def play(self, action_id, game_uuid=None, player_uuid=None):
+    @staticmethod
+    def parse_play(status, data):
         """
-            Call the Game Engine Service /games/{id}/play endpoint
             return: succeeded(bool)
         """
-        if not self.playing_locally:
-            sleep(3)
-        self.update_game_uuid(game_uuid)
-        self.update_player_uuid(player_uuid)
+        return status == 200
 
-        url = self.base_url + "games/{}/play?player_uuid={}&action_id={}".format(str(self.game_uuid), str(self.player_uuid), action_id)
-        succeeded = False
-        http = urllib3.PoolManager()
-        response = http.request("GET", url)
-        if response.status == 200:
-            succeeded = True
-        return succeeded
-
-    def get_game_state(self, game_uuid=None, player_uuid=None):
+    @staticmethod
+    def parse_game_state(status, data):
         """
-            Call the Game Engine Service /games/{id} endpoint
-            return: succeeded(bool), game_state(dict)
+            return: succeeded(bool), game_state(dict, None if the state didn't change)
         """
-        if not self.playing_locally:
-            sleep(1)
-        self.update_game_uuid(game_uuid)
-        self.update_player_uuid(player_uuid)
-
-        url = self.base_url + "games/{}?player_uuid={}".format(str(self.game_uuid), str(self.player_uuid))
+        if status == NOT_MODIFIED:
+            return True, None
         succeeded = False
         game_state = None
-        http = urllib3.PoolManager()
-        response = http.request("GET", url)
-        if response.status == 200:
-            response_obj = json.loads(response.data)
+        if status == 200:
+            response_obj = json.loads(data)
             if response_obj:
                 game_state = response_obj
                 succeeded = True
@@ -161,3 +194,132 @@ class GameManager(object):
                 print("Provided player_uuid is not valid and will be ignored.")
         if self.player_uuid is None or not isinstance(self.player_uuid, UUID):
             raise TypeError("player_uuid is required and must be type uuid.UUID")
+
+
+class GameManager(BaseGameManager):
+    """
+        Manager of API calls to the Blef Game Engine Service.
+        Requests go through http (see create_http), by default the connection pool
+        shared by the process. timeout and retries override those of the pool.
+        Requests are paced by rate_limiter, by default the one shared by all
+        GameManagers calling the same engine host (see rate_limit.get_rate_limiter),
+        unlimited until the engine throttles them. rate and burst, if given, set
+        the limit of that shared limiter (requests per second and burst size).
+    """
+
+    def __init__(self, base_url="http://localhost:8002/v2.1/", http=None, timeout=None, retries=None, rate_limiter=None,
+                 rate=None, burst=None):
+        super(GameManager, self).__init__(base_url)
+        self.http = http
+        self.timeout = timeout
+        self.retries = retries
+        self.last_error = None
+        # Requests repeated by urllib3 and after 429 responses
+        self.n_retries = 0
+        self.n_throttled = 0
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter(base_url, rate, burst)
+        self.test_connection(base_url, http=self.get_http())
+
+    def get_http(self):
+        return self.http if self.http is not None else get_shared_http()
+
+    def unsafe_retries(self):
+        """
+            return: retries(urllib3.Retry) for calls which must not be repeated
+                    once the engine may have received them
+        """
+        if self.retries is None:
+            return UNSAFE_RETRIES
+        return urllib3.Retry.from_int(self.retries).new(read=0, status=0)
+
+    @staticmethod
+    def test_connection(base_url, http=None):
+        """
+            Test whether it's possible to reach a valid
+            Game Engine Service at self.base_url
+        """
+        http = http if http is not None else get_shared_http()
+        try:
+            response = http.request("GET", base_url+"games")
+        except urllib3.exceptions.HTTPError as err:
+            raise ConnectionError("Can't reach a game engine at base_url: {}".format(err)) from err
+        if response.status != 200:
+            raise ConnectionError("base_url is not a valid base path of a running game engine")
+
+    def request(self, url, retries=None, timeout=None):
+        """
+            GET url using the connection pool, within the rate limit.
+            Throttled (429) requests are repeated after the time the engine asks for.
+            return: status(int, None if the request failed), data(bytes)
+        """
+        if retries is None:
+            retries = self.retries
+        if timeout is None:
+            timeout = self.timeout
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if retries is not None:
+            # urllib3 would otherwise sleep through 429 Retry-After itself, unknown to the rate limiter
+            kwargs["retries"] = urllib3.Retry.from_int(retries).new(respect_retry_after_header=False)
+        for _ in range(THROTTLED_RETRIES + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.get_http().request("GET", url, **kwargs)
+            except urllib3.exceptions.HTTPError as err:
+                self.last_error = err
+                return None, None
+            if response.retries is not None:
+                self.n_retries += len(response.retries.history)
+            if response.status != 429:
+                break
+            self.n_throttled += 1
+            self.rate_limiter.throttled(parse_retry_after(response.headers.get("Retry-After")))
+        return response.status, response.data
+
+    def create_game(self):
+        """
+            Call the Game Engine Service /create endpoint
+            return: succeeded(bool), game_uuid(uuid.UUID)
+        """
+        return self.parse_create_game(*self.request(self.create_game_url(), retries=self.unsafe_retries()))
+
+    def join_game(self, game_uuid, nickname):
+        """
+            Call the Game Engine Service /games/{id}/join endpoint
+            store uuids in the object.
+            return: succeeded(bool), player_uuid(uuid.UUID)
+        """
+        url = self.join_game_url(game_uuid, nickname)
+        return self.parse_join_game(game_uuid, *self.request(url, retries=self.unsafe_retries()))
+
+    def start_game(self, game_uuid=None, player_uuid=None):
+        """
+            Call the Game Engine Service /games/{id}/start endpoint
+            return: succeeded(bool)
+        """
+        url = self.start_game_url(game_uuid, player_uuid)
+        return self.parse_start_game(*self.request(url, retries=self.unsafe_retries()))
+
+    def play(self, action_id, game_uuid=None, player_uuid=None):
+        """
+            Call the Game Engine Service /games/{id}/play endpoint
+            return: succeeded(bool)
+        """
+        return self.parse_play(*self.request(self.play_url(action_id, game_uuid, player_uuid), retries=self.unsafe_retries()))
+
+    def get_game_state(self, game_uuid=None, player_uuid=None, version=None, wait=None):
+        """
+            Call the Game Engine Service /games/{id} endpoint,
+            long polling if version is given (see game_state_url)
+            return: succeeded(bool), game_state(dict, None if the state didn't change)
+        """
+        url = self.game_state_url(game_uuid, player_uuid, version, wait)
+        timeout = None
+        if wait:
+            timeout = self.timeout if self.timeout is not None else DEFAULT_TIMEOUT
+            if not isinstance(timeout, urllib3.Timeout):
+                timeout = urllib3.Timeout.from_float(timeout)
+            # The engine holds the request for up to wait seconds
+            timeout = urllib3.Timeout(connect=timeout.connect_timeout, read=timeout.read_timeout and timeout.read_timeout + wait)
+        return self.parse_game_state(*self.request(url, timeout=timeout))
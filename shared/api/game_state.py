@@ -0,0 +1,159 @@
+from shared.probabilities.cards import card_bit, mask_to_cards
+
+
+class GameState(object):
+    """
+        Compact state of a game of the local simpleschema engine.
+        Players are referred to by their integer index, hands are stored
+        as 24-bit card masks (see shared.probabilities.cards) and the active
+        players form a ring, so finding the next active player is O(1).
+        Convert to and from the JSON schema with to_dict / from_dict.
+        dealer (see shared.api.dealing) deals the rounds of the game - it is not
+        part of the JSON schema, so games built with from_dict have none.
+        Clones (see clone) share n_cards and the ring with their original until
+        either of them changes them - call unshare before mutating those lists.
+        hand_masks is only ever replaced, never mutated in place.
+    """
+
+    __slots__ = ("game_uuid", "status", "round_number", "max_cards", "nicknames",
+                 "n_cards", "hand_masks", "cp", "history", "next_active", "prev_active", "n_active", "dealer",
+                 "undo_stack", "shared")
+
+    def __init__(self, game_uuid, nicknames, n_cards, max_cards, status="Running", round_number=1, cp=0):
+        super(GameState, self).__init__()
+        self.game_uuid = game_uuid
+        self.status = status
+        self.round_number = round_number
+        self.max_cards = max_cards
+        self.nicknames = list(nicknames)
+        self.n_cards = list(n_cards)
+        self.hand_masks = [0] * len(self.nicknames)
+        self.cp = cp
+        # (player index, action_id) tuples of the current round
+        self.history = []
+        self.dealer = None
+        # Undo records of the moves made with simpleschema_local_manager.apply
+        self.undo_stack = []
+        self.shared = False
+        self.link_active_players()
+
+    def link_active_players(self):
+        """
+            Build the ring of active players (with cards, or the current player)
+        """
+        n_players = len(self.nicknames)
+        active = [i for i in range(n_players) if self.n_cards[i] != 0 or i == self.cp]
+        self.next_active = list(range(n_players))
+        self.prev_active = list(range(n_players))
+        for position, i in enumerate(active):
+            self.next_active[i] = active[(position + 1) % len(active)]
+            self.prev_active[i] = active[position - 1]
+        self.n_active = sum(1 for i in active if self.n_cards[i] != 0)
+
+    def eliminate(self, player):
+        """
+            Remove a player from the ring of active players.
+            next_active[player] still points to their successor.
+        """
+        self.next_active[self.prev_active[player]] = self.next_active[player]
+        self.prev_active[self.next_active[player]] = self.prev_active[player]
+        self.n_active -= 1
+
+    def restore(self, player):
+        """
+            Put an eliminated player back into the ring of active players,
+            undoing the last eliminate
+        """
+        self.next_active[self.prev_active[player]] = player
+        self.prev_active[self.next_active[player]] = player
+        self.n_active += 1
+
+    def unshare(self):
+        """
+            Take private copies of the lists shared with clones
+        """
+        if self.shared:
+            self.n_cards = list(self.n_cards)
+            self.next_active = list(self.next_active)
+            self.prev_active = list(self.prev_active)
+            self.shared = False
+
+    def clone(self, hand_masks=None, dealer=None):
+        """
+            Cheap copy-on-write copy of the game, e.g. for determinized rollouts
+            hand_masks: replaces the deal of the current round in the copy
+            dealer: deals the following rounds of the copy, the shared unseeded
+                    dealer of simpleschema_local_manager by default - the
+                    original's dealer is never shared, so its deals are unaffected
+            return: game(GameState), with an empty undo stack
+        """
+        game = GameState.__new__(GameState)
+        game.game_uuid = self.game_uuid
+        game.status = self.status
+        game.round_number = self.round_number
+        game.max_cards = self.max_cards
+        game.nicknames = self.nicknames
+        game.n_cards = self.n_cards
+        game.hand_masks = self.hand_masks if hand_masks is None else list(hand_masks)
+        game.cp = self.cp
+        game.history = list(self.history)
+        game.next_active = self.next_active
+        game.prev_active = self.prev_active
+        game.n_active = self.n_active
+        game.dealer = dealer
+        game.undo_stack = []
+        game.shared = self.shared = True
+        return game
+
+    @property
+    def cp_nickname(self):
+        if self.cp is None:
+            return None
+        return self.nicknames[self.cp]
+
+    def player_index(self, nickname):
+        return self.nicknames.index(nickname)
+
+    def deal_mask(self):
+        """
+            return: card mask of all cards in the game(int)
+        """
+        deal_mask = 0
+        for hand_mask in self.hand_masks:
+            deal_mask |= hand_mask
+        return deal_mask
+
+    def to_dict(self):
+        """
+            Convert to the JSON schema of the game state
+            return: game(dict)
+        """
+        return {
+            "game_uuid": self.game_uuid,
+            "status": self.status,
+            "round_number": self.round_number,
+            "max_cards": self.max_cards,
+            "hands": [{"nickname": nickname, "hand": [{"value": value, "colour": colour} for value, colour in mask_to_cards(hand_mask)]}
+                      for nickname, hand_mask in zip(self.nicknames, self.hand_masks)],
+            "players": [{"nickname": nickname, "n_cards": n_cards} for nickname, n_cards in zip(self.nicknames, self.n_cards)],
+            "cp_nickname": self.cp_nickname,
+            "history": [{"player": self.nicknames[player], "action_id": action_id} for player, action_id in self.history]
+        }
+
+    @classmethod
+    def from_dict(cls, game):
+        """
+            Build from the JSON schema of the game state
+            return: game(GameState)
+        """
+        nicknames = [player["nickname"] for player in game["players"]]
+        cp = nicknames.index(game["cp_nickname"]) if game.get("cp_nickname") is not None else None
+        state = cls(game["game_uuid"], nicknames, [int(player["n_cards"]) for player in game["players"]], game["max_cards"],
+                    status=game["status"], round_number=int(game["round_number"]), cp=cp)
+        for hand in game.get("hands", []):
+            hand_mask = 0
+            for card in hand["hand"]:
+                hand_mask |= card_bit(card["value"], card["colour"])
+            state.hand_masks[nicknames.index(hand["nickname"])] = hand_mask
+        state.history = [(nicknames.index(entry["player"]), entry["action_id"]) for entry in game.get("history", [])]
+        return state
@@ -0,0 +1,194 @@
+"""
+    Incremental ingestion of the game state snapshots saved by the local engine
+    (games/<game_uuid>_<round_number>, see persistence.FilePersistence) into a
+    columnar dataset of two tables:
+        actions - one row per action: who played what, and whether the set exists
+                  in the deal / in the player's own hand (for checks: the checked set)
+        rounds  - one row per round outcome: the check, the loser and eliminations
+    Both tables are stored in chunks of about chunk_size action rows, one .npz file per chunk
+    with one array per column. state.json keeps the watermark - snapshots modified
+    before it are already ingested - and the number of complete chunks.
+"""
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from shared.api.game_state import GameState
+from shared.api.simpleschema_local_manager import CHECK, set_exists
+
+
+STATE_FILENAME = "state.json"
+TABLES = ("actions", "rounds")
+COLUMNS = {
+    "actions": ("game_uuid", "round_number", "position", "player", "action_id",
+                "n_cards", "others_card_num", "set_exists", "in_hand"),
+    "rounds": ("game_uuid", "round_number", "n_players", "n_cards_total", "n_actions", "starting_player",
+               "checked_player", "checking_player", "checked_action_id", "set_exists", "loser", "eliminated", "winner")
+}
+DTYPES = {
+    "game_uuid": "U36", "player": "U", "starting_player": "U", "checked_player": "U",
+    "checking_player": "U", "loser": "U", "winner": "U",
+    "round_number": np.int32, "position": np.int16, "action_id": np.int8, "checked_action_id": np.int8,
+    "n_cards": np.int8, "others_card_num": np.int16, "n_players": np.int8, "n_cards_total": np.int16,
+    "n_actions": np.int16, "set_exists": bool, "in_hand": bool, "eliminated": bool
+}
+
+
+def chunk_filename(output_dir, table, chunk):
+    return os.path.join(output_dir, "{}-{:06d}.npz".format(table, chunk))
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILENAME)) as filehandle:
+            return json.load(filehandle)
+    except FileNotFoundError:
+        return {"watermark_ns": 0, "n_chunks": 0}
+
+
+def save_state(output_dir, state):
+    filename = os.path.join(output_dir, STATE_FILENAME)
+    with open(filename + ".tmp", "w") as filehandle:
+        json.dump(state, filehandle)
+    os.replace(filename + ".tmp", filename)
+
+
+def round_rows(game):
+    """
+        Convert the snapshot of a round which just ended into table rows
+        game: GameState, with the loser marked at the end of its history
+        return: action rows(list of tuples), round row(tuple)
+    """
+    deal_mask = game.deal_mask()
+    total_cards = sum(game.n_cards)
+    actions = game.history[:-1]
+    action_rows = []
+    for position, (player, action_id) in enumerate(actions):
+        bet = action_id if action_id != CHECK else actions[position - 1][1]
+        action_rows.append((game.game_uuid, game.round_number, position, game.nicknames[player], action_id,
+                            game.n_cards[player], total_cards - game.n_cards[player],
+                            set_exists(deal_mask, bet), set_exists(game.hand_masks[player], bet)))
+
+    checked_player, checked_action_id = actions[-2]
+    loser = game.history[-1][0]
+    active = [player for player, n_cards in enumerate(game.n_cards) if n_cards > 0]
+    eliminated = game.n_cards[loser] + 1 > game.max_cards
+    winner = ""
+    if eliminated and len(active) == 2:
+        winner = game.nicknames[active[0] if active[1] == loser else active[1]]
+    round_row = (game.game_uuid, game.round_number, len(active), total_cards, len(actions),
+                 game.nicknames[actions[0][0]], game.nicknames[checked_player], game.nicknames[actions[-1][0]],
+                 checked_action_id, set_exists(deal_mask, checked_action_id), game.nicknames[loser], eliminated, winner)
+    return action_rows, round_row
+
+
+class ChunkWriter(object):
+    """
+        Buffers table rows in preallocated column arrays and writes them as
+        numbered columnar chunks, once chunk_size action rows are buffered
+    """
+
+    def __init__(self, output_dir, chunk_size, first_chunk=0):
+        super(ChunkWriter, self).__init__()
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.n_chunks = first_chunk
+        # A round has at most CHECK + 1 actions (every bet, then the check),
+        # and at least 2, so the rounds of a chunk never outgrow these
+        capacity = {"actions": chunk_size + CHECK + 1}
+        capacity["rounds"] = capacity["actions"] // 2 + 1
+        # Strings are buffered as references and only converted to fixed width on writing
+        self.columns = {}
+        for table in TABLES:
+            self.columns[table] = {}
+            for name in COLUMNS[table]:
+                dtype = object if np.dtype(DTYPES[name]).kind == "U" else DTYPES[name]
+                self.columns[table][name] = np.empty(capacity[table], dtype=dtype)
+        self.size = {table: 0 for table in TABLES}
+
+    def append_rows(self, table, rows):
+        start = self.size[table]
+        for name, values in zip(COLUMNS[table], zip(*rows)):
+            self.columns[table][name][start:start + len(rows)] = values
+        self.size[table] += len(rows)
+
+    def append(self, action_rows, round_row):
+        self.append_rows("actions", action_rows)
+        self.append_rows("rounds", [round_row])
+        if self.size["actions"] >= self.chunk_size:
+            self.write_chunk()
+
+    def write_chunk(self):
+        if not self.size["rounds"]:
+            return
+        for table in TABLES:
+            columns = {name: column[:self.size[table]].astype(DTYPES[name])
+                       for name, column in self.columns[table].items()}
+            filename = chunk_filename(self.output_dir, table, self.n_chunks)
+            with open(filename + ".tmp", "wb") as filehandle:
+                np.savez_compressed(filehandle, **columns)
+            os.replace(filename + ".tmp", filename)
+            self.size[table] = 0
+        self.n_chunks += 1
+
+
+def ingest(games_dir="games", output_dir="games_dataset", chunk_size=100000, min_age=2.0):
+    """
+        Ingest the snapshots of games_dir saved since the last run.
+        Only the snapshots of ended rounds are read, and snapshots modified in the
+        last min_age seconds are left for the next run, as they may be incomplete.
+        An interrupted run is redone by the next one: its chunks are overwritten.
+        return: number of ingested snapshots(int)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    cutoff_ns = time.time_ns() - int(min_age * 1e9)
+    writer = ChunkWriter(output_dir, chunk_size, first_chunk=state["n_chunks"])
+    n_snapshots = 0
+    with os.scandir(games_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            modified_ns = entry.stat().st_mtime_ns
+            if not state["watermark_ns"] <= modified_ns < cutoff_ns:
+                continue
+            with open(entry.path) as filehandle:
+                game = json.load(filehandle)
+            history = game.get("history", [])
+            if not history or history[-1]["action_id"] != 89:
+                continue
+            writer.append(*round_rows(GameState.from_dict(game)))
+            n_snapshots += 1
+    writer.write_chunk()
+    save_state(output_dir, {"watermark_ns": cutoff_ns, "n_chunks": writer.n_chunks})
+    return n_snapshots
+
+
+def iter_chunks(output_dir="games_dataset", table="actions", columns=None):
+    """
+        Stream a table chunk by chunk, reading only the given columns
+        return: generator of pd.DataFrame
+    """
+    columns = COLUMNS[table] if columns is None else columns
+    for chunk in range(load_state(output_dir)["n_chunks"]):
+        with np.load(chunk_filename(output_dir, table, chunk)) as data:
+            yield pd.DataFrame({name: data[name] for name in columns})
+
+
+def load_table(output_dir="games_dataset", table="actions", columns=None):
+    """
+        Load a whole table
+        return: table(pd.DataFrame)
+    """
+    chunks = list(iter_chunks(output_dir, table, columns))
+    if not chunks:
+        return pd.DataFrame(columns=COLUMNS[table] if columns is None else columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+if __name__ == "__main__":
+    """ Run script manually - ingest new snapshots: python ingest.py [games_dir] [output_dir] """
+    n_snapshots = ingest(*sys.argv[1:3])
+    print("Ingested {} rounds".format(n_snapshots))
@@ -0,0 +1,286 @@
+"""
+    Local stand-in for the Blef Game Engine Service, backed by the
+    simpleschema_local_manager engine. It serves the endpoints used by GameManager:
+        GET /v2.1/games                                     - the games which haven't finished
+        GET /v2.1/games/create                              - {"game_uuid"}
+        GET /v2.1/games/{id}/join?nickname=                 - {"player_uuid"}, the first player is the admin
+        GET /v2.1/games/{id}/start?admin_uuid=              - 202 {"message": "Game started"}
+        GET /v2.1/games/{id}/play?player_uuid=&action_id=   - the player's view of the game state
+        GET /v2.1/games/{id}?player_uuid=                   - the player's view of the game state,
+            long polled if given status, round_number, history_length and wait (see StateWatcher)
+    Errors are answered with 400/404 and {"error": message}.
+    Run: python -m shared.api.local_server [port]
+"""
+import sys
+import json
+import uuid
+import threading
+from time import monotonic
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import shared.api.simpleschema_local_manager as local_manager
+from shared.api.game_manager import NOT_MODIFIED
+from shared.api.persistence import DisabledPersistence
+from shared.api.state_watcher import state_version
+
+
+API_PREFIX = "/v2.1/"
+# Longest long poll the server holds, in seconds
+MAX_WAIT = 60.0
+# Seconds a finished game stays available to its players, after which it is dropped
+FINISHED_TTL = 300.0
+
+
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+class HostedGame(object):
+    """A game hosted by the server: its players and, once started, its GameState."""
+
+    def __init__(self, game_uuid, persistence):
+        super(HostedGame, self).__init__()
+        self.game_uuid = game_uuid
+        self.persistence = persistence
+        # nickname -> player_uuid, in the order of joining
+        self.players = {}
+        self.state = None
+        # monotonic() time the game finished at
+        self.finished_at = None
+        # Held while using the game, notified on every change
+        self.condition = threading.Condition()
+
+    def nickname(self, player_uuid):
+        for nickname, uuid_ in self.players.items():
+            if uuid_ == player_uuid:
+                return nickname
+        raise RequestError("Unknown player_uuid")
+
+    def view(self, nickname=None):
+        """
+            The game state as seen by the player nickname (their hand only)
+            return: game_state(dict)
+        """
+        if self.state is None:
+            return {"game_uuid": self.game_uuid, "status": "Not started", "round_number": 0, "max_cards": None,
+                    "players": [{"nickname": nickname, "n_cards": 0} for nickname in self.players],
+                    "hands": [], "cp_nickname": None, "history": []}
+        game_state = self.state.to_dict()
+        game_state["hands"] = [hand for hand in game_state["hands"] if hand["nickname"] == nickname]
+        return game_state
+
+    def join(self, nickname):
+        if not nickname:
+            raise RequestError("nickname is required")
+        if self.state is not None:
+            raise RequestError("The game has already started")
+        if nickname in self.players:
+            raise RequestError("The nickname is already taken")
+        self.players[nickname] = str(uuid.uuid4())
+        self.condition.notify_all()
+        return {"player_uuid": self.players[nickname]}
+
+    def start(self, admin_uuid):
+        if not self.players or admin_uuid != next(iter(self.players.values())):
+            raise RequestError("Only the admin can start the game")
+        if self.state is not None:
+            raise RequestError("The game has already started")
+        if len(self.players) < 2:
+            raise RequestError("At least 2 players are needed")
+        players = local_manager.arrange_players([{"nickname": nickname} for nickname in self.players])
+        self.state = local_manager.create_game(len(players), nicknames=[player["nickname"] for player in players],
+                                              game_uuid=self.game_uuid)
+        self.condition.notify_all()
+        return {"message": "Game started"}
+
+    def play(self, player_uuid, action_id):
+        nickname = self.nickname(player_uuid)
+        state = self.state
+        if state is None or state.status != "Running":
+            raise RequestError("The game is not running")
+        if state.cp_nickname != nickname:
+            raise RequestError("It's not this player's turn")
+        try:
+            action_id = int(action_id)
+        except (TypeError, ValueError):
+            raise RequestError("action_id must be an integer")
+        last_bet = state.history[-1][1] if state.history else None
+        if not 0 <= action_id <= local_manager.CHECK or (last_bet is None and action_id == local_manager.CHECK) \
+                or (last_bet is not None and action_id != local_manager.CHECK and action_id <= last_bet):
+            raise RequestError("Illegal action_id")
+        local_manager.play(state, action_id, backend=self.persistence)
+        if state.status != "Running":
+            self.finished_at = monotonic()
+        self.condition.notify_all()
+        return self.view(nickname)
+
+    def get_state(self, player_uuid, query):
+        """
+            Long poll: wait while the player's view has the version given in the query
+            return: game_state(dict), None if it didn't change before the wait ended
+        """
+        nickname = self.nickname(player_uuid) if player_uuid else None
+        game_state = self.view(nickname)
+        if "wait" not in query:
+            return game_state
+        known = (query.get("status"), query.get("round_number"), query.get("history_length"))
+        deadline = monotonic() + min(MAX_WAIT, float(query["wait"]))
+        while tuple(str(value) for value in state_version(game_state)) == known:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            self.condition.wait(remaining)
+            game_state = self.view(nickname)
+        return game_state
+
+
+class LocalEngine(object):
+    """
+        The games hosted by the server, saving game states with persistence.
+        Finished games are dropped FINISHED_TTL seconds after they end.
+    """
+
+    def __init__(self, persistence):
+        super(LocalEngine, self).__init__()
+        self.persistence = persistence
+        self.games = {}
+        # game_uuid -> finished_at of the finished games, in the order of finishing
+        self.finished = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add_finished(self, game):
+        with self.lock:
+            self.finished[game.game_uuid] = game.finished_at
+
+    def evict_finished(self):
+        """
+            Drop the games which finished more than FINISHED_TTL seconds ago
+        """
+        cutoff = monotonic() - FINISHED_TTL
+        with self.lock:
+            while self.finished and next(iter(self.finished.values())) <= cutoff:
+                game_uuid, _ = self.finished.popitem(last=False)
+                del self.games[game_uuid]
+
+    def create_game(self):
+        self.evict_finished()
+        game = HostedGame(str(uuid.uuid4()), self.persistence)
+        with self.lock:
+            self.games[game.game_uuid] = game
+        return {"game_uuid": game.game_uuid}
+
+    def get_game(self, game_uuid):
+        with self.lock:
+            game = self.games.get(game_uuid)
+        if game is None:
+            raise RequestError("Game not found", status=404)
+        return game
+
+    def list_games(self):
+        """
+            return: the games which haven't finished(list of dict)
+        """
+        with self.lock:
+            games = [game for game_uuid, game in self.games.items() if game_uuid not in self.finished]
+        return [{"game_uuid": game.game_uuid, "players": list(game.players),
+                 "status": "Not started" if game.state is None else game.state.status} for game in games]
+
+    def handle(self, path, query):
+        """
+            return: status(int), response(JSON-serialisable, None for 304 Not Modified)
+        """
+        if not path.startswith(API_PREFIX):
+            raise RequestError("Not found", status=404)
+        parts = path[len(API_PREFIX):].strip("/").split("/")
+        if parts[0] != "games":
+            raise RequestError("Not found", status=404)
+        if len(parts) == 1:
+            return 200, self.list_games()
+        if parts[1:] == ["create"]:
+            return 200, self.create_game()
+        game = self.get_game(parts[1])
+        endpoint = parts[2] if len(parts) == 3 else None
+        if len(parts) > 3 or endpoint not in (None, "join", "start", "play"):
+            raise RequestError("Not found", status=404)
+        with game.condition:
+            if endpoint == "join":
+                return 200, game.join(query.get("nickname"))
+            if endpoint == "start":
+                return 202, game.start(query.get("admin_uuid"))
+            if endpoint == "play":
+                game_state = game.play(query.get("player_uuid"), query.get("action_id"))
+                if game.finished_at is not None:
+                    self.add_finished(game)
+                return 200, game_state
+            game_state = game.get_state(query.get("player_uuid"), query)
+            return (200, game_state) if game_state is not None else (NOT_MODIFIED, None)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately - don't let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        try:
+            status, response = self.server.engine.handle(url.path, query)
+        except RequestError as err:
+            status, response = err.status, {"error": str(err)}
+        except ValueError as err:
+            status, response = 400, {"error": str(err)}
+        self.send_response(status)
+        if response is None:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(response).encode("utf-8")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(RequestHandler, self).log_message(format, *args)
+
+
+class LocalServer(ThreadingHTTPServer):
+    """
+        HTTP server of a LocalEngine, one thread per connection.
+        Game states are saved with persistence (a shared.api.persistence backend),
+        not at all by default. Other users of the local engine in the process
+        keep their own backend (see simpleschema_local_manager.set_persistence).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="localhost", port=8002, persistence=None, verbose=False):
+        super(LocalServer, self).__init__((host, port), RequestHandler)
+        self.engine = LocalEngine(persistence if persistence is not None else DisabledPersistence())
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}{}".format(host, port, API_PREFIX)
+
+    def start(self):
+        """
+            Serve in a background thread
+            return: base_url(str) for GameManager
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self.base_url
+
+
+if __name__ == "__main__":
+    """ Run script manually - serve the local engine: python -m shared.api.local_server [port] """
+    server = LocalServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8002, verbose=True)
+    print("Serving the local game engine at {}".format(server.base_url))
+    server.serve_forever()
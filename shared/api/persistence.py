@@ -0,0 +1,163 @@
+import os
+import json
+import gzip
+import queue
+import atexit
+import threading
+from copy import deepcopy
+
+
+def snapshot(game):
+    """
+        Take an independent copy of a game state, safe to serialise later
+        return: game(dict in the JSON schema)
+    """
+    if hasattr(game, "to_dict"):
+        return game.to_dict()
+    return deepcopy(game)
+
+
+def state_id(game):
+    return game["game_uuid"] + "_" + str(int(game["round_number"]))
+
+
+class Persistence(object):
+    """Base class for backends storing game state snapshots of the local engine."""
+
+    def save(self, game):
+        raise NotImplementedError
+
+    def flush(self):
+        """
+            Block until all saved snapshots are written
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class DisabledPersistence(Persistence):
+    """Backend that drops all snapshots."""
+
+    def save(self, game):
+        pass
+
+
+class BackgroundPersistence(Persistence):
+    """
+        Base class for backends writing snapshots in batches on a background
+        writer thread, so that saving never blocks on disk.
+        Subclasses implement write_batch, which receives the queued items
+        (game state snapshots, unless the subclass overrides save).
+    """
+
+    STOP = object()
+
+    def __init__(self, batch_size=256, max_queue_size=65536):
+        super(BackgroundPersistence, self).__init__()
+        self.batch_size = batch_size
+        # Bounded, so a slow disk applies back-pressure instead of exhausting memory
+        self.queue = queue.Queue(max_queue_size)
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def save(self, game):
+        self.put(snapshot(game))
+
+    def put(self, item):
+        """
+            Queue an item for write_batch
+        """
+        self.raise_error()
+        if self.closed:
+            raise ValueError("The persistence backend is closed")
+        self.queue.put(item)
+
+    def flush(self):
+        if not self.closed:
+            flushed = threading.Event()
+            self.queue.put(flushed)
+            flushed.wait()
+        self.raise_error()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(self.STOP)
+            self.thread.join()
+            self.close_output()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise IOError("Failed to save game states: {}".format(error))
+
+    def run(self):
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not self.STOP and not isinstance(item, threading.Event)]
+            try:
+                if items:
+                    self.write_batch(items)
+            except Exception as err:
+                self.error = err
+            for item in batch:
+                if item is self.STOP:
+                    done = True
+                elif isinstance(item, threading.Event):
+                    item.set()
+
+    def write_batch(self, games):
+        raise NotImplementedError
+
+    def close_output(self):
+        pass
+
+
+class FilePersistence(BackgroundPersistence):
+    """Backend writing one JSON file per game state: <dir>/<game_uuid>_<round_number>"""
+
+    def __init__(self, dir="games", **kwargs):
+        os.makedirs(dir, exist_ok=True)
+        self.dir = dir
+        super(FilePersistence, self).__init__(**kwargs)
+
+    def write_batch(self, games):
+        for game in games:
+            with open(os.path.join(self.dir, state_id(game)), "w") as filehandle:
+                json.dump(game, filehandle)
+
+
+class StreamPersistence(BackgroundPersistence):
+    """
+        Backend appending game states to a single JSON lines file,
+        gzip-compressed if compress (by default, if filename ends with .gz)
+    """
+
+    def __init__(self, filename="games.jsonl", compress=None, **kwargs):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if compress is None:
+            compress = filename.endswith(".gz")
+        self.filename = filename
+        self.filehandle = gzip.open(filename, "at") if compress else open(filename, "a")
+        super(StreamPersistence, self).__init__(**kwargs)
+
+    def write_batch(self, games):
+        self.filehandle.write("".join(json.dumps(game) + "\n" for game in games))
+        self.filehandle.flush()
+
+    def close_output(self):
+        self.filehandle.close()
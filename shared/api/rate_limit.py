@@ -0,0 +1,151 @@
+import threading
+from time import monotonic, sleep
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib3.util import parse_url
+
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+# Requests per second and burst per engine host - unlimited until the engine throttles
+DEFAULT_RATE = None
+DEFAULT_BURST = 4
+# Without a configured rate, a throttled limiter is lifted again once its rate
+# recovers to this many times the request rate at which it was throttled
+UNLIMITED_AFTER = 4.0
+# Wait after a 429 response without a Retry-After header, in seconds
+DEFAULT_RETRY_AFTER = 1.0
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def is_local(base_url):
+    return parse_url(base_url).host in LOCAL_HOSTS
+
+
+def parse_retry_after(value):
+    """
+        Parse a Retry-After header, given in seconds or as an HTTP date
+        return: seconds to wait(float), None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter(object):
+    """
+        Thread-safe token bucket: up to burst requests at once, refilled at rate
+        requests per second, unlimited if rate is None.
+        Throttling by the server (throttled) pauses all requests for the given
+        time and halves the rate - without a limit, the rate requests were being
+        made at - which then recovers gradually with every request allowed:
+        back up to the configured rate, or, without one, until it's unlimited
+        again (UNLIMITED_AFTER), so the limiter keeps probing for what the server allows.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=0.1, recovery=0.05):
+        super(RateLimiter, self).__init__()
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        # Requests made in the current second, to know the request rate when throttled
+        self.window_start = monotonic()
+        self.window_count = 0
+        self.request_rate = 0.0
+        self.unlimited_above = None
+        self.configure(rate, burst)
+
+    def configure(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+            Set the limit: rate requests per second (None - unlimited until throttled)
+            with bursts of up to burst requests
+        """
+        with self.lock:
+            self.max_rate = rate
+            self.rate = rate
+            self.burst = burst
+            self.tokens = float(burst)
+            self.updated = monotonic()
+            self.unlimited_above = None
+
+    def reserve(self):
+        """
+            Take a token
+            return: time to wait before making the request(float)
+        """
+        with self.lock:
+            now = monotonic()
+            if now - self.window_start >= 1.0:
+                self.request_rate = self.window_count / (now - self.window_start)
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            wait = max(0.0, self.paused_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            self.rate *= 1 + self.recovery
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate)
+            elif self.rate >= self.unlimited_above:
+                self.rate = None
+            return wait
+
+    def acquire(self):
+        """
+            Block until a request is allowed
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+
+    def throttled(self, retry_after=None):
+        """
+            Handle a 429 response of the server
+            retry_after: seconds to wait, see parse_retry_after
+        """
+        with self.lock:
+            retry_after = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+            now = monotonic()
+            self.paused_until = max(self.paused_until, now + retry_after)
+            if self.rate is None:
+                # Unlimited until now - start from the rate requests were made at
+                rate = max(self.request_rate, self.window_count / max(1.0, now - self.window_start))
+                self.unlimited_above = max(self.min_rate, rate) * UNLIMITED_AFTER
+                self.rate = max(self.min_rate, rate / 2)
+                self.tokens = float(self.burst)
+                self.updated = now
+            else:
+                self.rate = max(self.min_rate, self.rate / 2)
+
+
+def get_rate_limiter(base_url, rate=None, burst=None):
+    """
+        Get the rate limiter shared by everything calling the engine host of base_url.
+        By default requests are unlimited until the engine throttles them (see RateLimiter).
+        rate and burst, if given, reconfigure the host's limiter for all its users.
+        return: limiter(RateLimiter)
+    """
+    url = parse_url(base_url)
+    key = (url.host, url.port)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(DEFAULT_RATE, DEFAULT_BURST)
+        limiter = _limiters[key]
+    if rate is not None or burst is not None:
+        limiter.configure(rate if rate is not None else limiter.max_rate,
+                          burst if burst is not None else limiter.burst)
+    return limiter
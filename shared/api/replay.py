@@ -0,0 +1,244 @@
+"""
+    Compact binary replay format of games of the local simpleschema engine.
+
+    A replay file is a stream of records, each starting with a one byte tag:
+        MAGIC (b"BLEFREPLAY" + version) - starts every writing session
+        b"G" game header:  game index(uint32), game uuid(16 bytes), has seed(uint8), seed(uint64),
+                           n_players(uint8), max_cards(uint8), then per player
+                           nickname length(uint8) and the nickname(utf-8)
+        b"R" round:        game index(uint32), round_number(uint16), starting player(uint8),
+                           n_actions(uint8), then n_cards(uint8) and the hand mask(24 bits)
+                           of every player, the actions(uint8 each, the last one is the check)
+                           and the losing player(uint8)
+        b"E" game end:     game index(uint32)
+    All integers are little-endian. The game index identifies a game within a session.
+"""
+import os
+import gzip
+import uuid
+import struct
+from shared.api.game_state import GameState
+from shared.api.persistence import BackgroundPersistence
+
+
+VERSION = 1
+MAGIC = b"BLEFREPLAY" + bytes([VERSION])
+GAME = b"G"
+ROUND = b"R"
+END = b"E"
+CHECK = 88
+LOST = 89
+
+INDEX = struct.Struct("<I")
+GAME_HEADER = struct.Struct("<I16sBQBB")
+ROUND_HEADER = struct.Struct("<IHBB")
+MASK_BYTES = 3
+
+
+def open_replay(filename, mode):
+    """
+        Open a replay file, gzip-compressed if filename ends with .gz
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+
+class ReplayRound(object):
+    """One round of a replay: the deal, the actions and the loser."""
+
+    __slots__ = ("round_number", "starting_player", "n_cards", "hand_masks", "actions", "loser")
+
+    def __init__(self, round_number, starting_player, n_cards, hand_masks, actions, loser):
+        super(ReplayRound, self).__init__()
+        self.round_number = round_number
+        self.starting_player = starting_player
+        # bytes - numbers of cards of the players, 0 for eliminated players
+        self.n_cards = n_cards
+        self.hand_masks = hand_masks
+        # bytes - action_ids in order, the last one being the check
+        self.actions = actions
+        self.loser = loser
+
+    def history(self):
+        """
+            Rebuild the history of the round, as stored in GameState.history
+            return: history(list of (player index, action_id) tuples)
+        """
+        active = [player for player, n_cards in enumerate(self.n_cards) if n_cards > 0]
+        position = active.index(self.starting_player)
+        history = []
+        for action_id in self.actions:
+            history.append((active[position], action_id))
+            if action_id != CHECK:
+                position = (position + 1) % len(active)
+        history.append((self.loser, LOST))
+        return history
+
+
+class Replay(object):
+    """A game read from a replay file."""
+
+    __slots__ = ("game_uuid", "seed", "nicknames", "max_cards", "rounds", "finished")
+
+    def __init__(self, game_uuid, seed, nicknames, max_cards):
+        super(Replay, self).__init__()
+        self.game_uuid = game_uuid
+        self.seed = seed
+        self.nicknames = nicknames
+        self.max_cards = max_cards
+        self.rounds = []
+        self.finished = False
+
+
+def encode_game_header(index, game):
+    seed = getattr(game.dealer, "seed", None)
+    has_seed = isinstance(seed, int) and 0 <= seed < 1 << 64
+    record = [GAME, GAME_HEADER.pack(index, uuid.UUID(game.game_uuid).bytes, has_seed, seed if has_seed else 0,
+                                     len(game.nicknames), game.max_cards)]
+    for nickname in game.nicknames:
+        nickname = nickname.encode("utf-8")
+        record.append(bytes([len(nickname)]))
+        record.append(nickname)
+    return b"".join(record)
+
+
+def encode_round(index, game):
+    """
+        Encode the round of game which just ended, i.e. with the loser
+        marked at the end of game.history
+    """
+    actions = bytes(action_id for _, action_id in game.history[:-1])
+    record = [ROUND, ROUND_HEADER.pack(index, game.round_number, game.history[0][0], len(actions)), bytes(game.n_cards)]
+    for hand_mask in game.hand_masks:
+        record.append(hand_mask.to_bytes(MASK_BYTES, "little"))
+    record.append(actions)
+    record.append(bytes([game.history[-1][0]]))
+    return b"".join(record)
+
+
+class ReplayPersistence(BackgroundPersistence):
+    """
+        Backend appending games to a replay file. Records are encoded when saved,
+        so the file only receives a few bytes per round.
+        filename may contain {pid} (e.g. "replays/{pid}.blefr"), so that
+        processes running games in parallel write separate files.
+    """
+
+    def __init__(self, filename="games.blefr", **kwargs):
+        filename = filename.format(pid=os.getpid())
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self.filehandle = open_replay(filename, "ab")
+        self.filehandle.write(MAGIC)
+        # game_uuid -> game index of the games started in this session
+        self.games = {}
+        self.n_games = 0
+        super(ReplayPersistence, self).__init__(**kwargs)
+
+    def save(self, game):
+        if isinstance(game, dict):
+            game = GameState.from_dict(game)
+        index = self.games.get(game.game_uuid)
+        if game.history and game.history[-1][1] == LOST:
+            if index is None:
+                index = self.games[game.game_uuid] = self.n_games
+                self.n_games += 1
+                self.put(encode_game_header(index, game))
+            self.put(encode_round(index, game))
+        elif game.status == "Finished" and index is not None:
+            del self.games[game.game_uuid]
+            self.put(END + INDEX.pack(index))
+
+    def write_batch(self, records):
+        self.filehandle.write(b"".join(records))
+        self.filehandle.flush()
+
+    def close_output(self):
+        self.filehandle.close()
+
+
+def read_exactly(filehandle, size):
+    data = filehandle.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated replay file")
+    return data
+
+
+def read_records(filename):
+    """
+        Stream the records of a replay file
+        return: generator of (tag, index, payload) - payload is a Replay (without rounds)
+                for b"G", a ReplayRound for b"R" and None for b"E" and MAGIC (index None)
+    """
+    games = {}
+    with open_replay(filename, "rb") as filehandle:
+        while True:
+            tag = filehandle.read(1)
+            if not tag:
+                return
+            if tag == MAGIC[:1]:
+                magic = tag + read_exactly(filehandle, len(MAGIC) - 1)
+                if magic != MAGIC:
+                    raise ValueError("Not a replay file of version {}: {}".format(VERSION, filename))
+                games = {}
+                yield MAGIC, None, None
+            elif tag == GAME:
+                index, game_uuid, has_seed, seed, n_players, max_cards = GAME_HEADER.unpack(read_exactly(filehandle, GAME_HEADER.size))
+                nicknames = [read_exactly(filehandle, read_exactly(filehandle, 1)[0]).decode("utf-8") for _ in range(n_players)]
+                games[index] = Replay(str(uuid.UUID(bytes=game_uuid)), seed if has_seed else None, nicknames, max_cards)
+                yield GAME, index, games[index]
+            elif tag == ROUND:
+                index, round_number, starting_player, n_actions = ROUND_HEADER.unpack(read_exactly(filehandle, ROUND_HEADER.size))
+                n_players = len(games[index].nicknames)
+                data = read_exactly(filehandle, n_players * (1 + MASK_BYTES) + n_actions + 1)
+                masks = data[n_players:n_players * (1 + MASK_BYTES)]
+                hand_masks = [int.from_bytes(masks[i:i + MASK_BYTES], "little") for i in range(0, len(masks), MASK_BYTES)]
+                yield ROUND, index, ReplayRound(round_number, starting_player, data[:n_players], hand_masks,
+                                                data[n_players * (1 + MASK_BYTES):-1], data[-1])
+            elif tag == END:
+                index, = INDEX.unpack(read_exactly(filehandle, INDEX.size))
+                del games[index]
+                yield END, index, None
+            else:
+                raise ValueError("Unknown replay record {!r} in {}".format(tag, filename))
+
+
+def read_rounds(filename):
+    """
+        Stream the rounds of a replay file, without collecting whole games
+        return: generator of (Replay without rounds, ReplayRound)
+    """
+    games = {}
+    for tag, index, payload in read_records(filename):
+        if tag == GAME:
+            games[index] = payload
+        elif tag == ROUND:
+            yield games[index], payload
+
+
+def read_replays(filename):
+    """
+        Stream the games of a replay file, each once it is complete.
+        Games unfinished when their writing session ended are yielded
+        with finished=False.
+        return: generator of Replay
+    """
+    games = {}
+    for tag, index, payload in read_records(filename):
+        if tag == GAME:
+            games[index] = payload
+        elif tag == ROUND:
+            games[index].rounds.append(payload)
+        elif tag == END:
+            replay = games.pop(index)
+            replay.finished = True
+            yield replay
+        else:
+            for replay in games.values():
+                yield replay
+            games = {}
+    for replay in games.values():
+        yield replay
@@ -1,9 +1,12 @@
 import uuid
 from math import floor
-from random import shuffle, sample, choice
-from itertools import islice, product
-import json
-import os
+from random import shuffle, choice
+import numpy as np
+from shared.probabilities.cards import N_VALUES, N_COLOURS, VALUE_BITS, COLOUR_BITS, SMALL_STRAIGHT, BIG_STRAIGHT, GREAT_STRAIGHT, \
+    mask_values, card_bit, popcount, masks_to_array, mask_to_cards
+from shared.api.game_state import GameState
+from shared.api.dealing import Dealer
+from shared.api import persistence
 
 
 CHECK = 88
@@ -117,73 +120,193 @@ def load_indexation():
 INDEXATION = load_indexation()
 
 
-def save(game, dir="games"):
-    state_id = game["game_uuid"] + "_" + str(int(game['round_number']))
-    filename = os.path.join(dir, state_id)
-    with open(filename, "w") as filehandle:
-        json.dump(game, filehandle)
+_persistence = None
 
 
-def determine_set_existence(cards, action_id):
-    try:
-        action_id = int(action_id)
-        set_row = INDEXATION[action_id]
+def get_persistence():
+    """
+        Get the backend saving game states, by default
+        one JSON file per game state under games/, written in the background
+        return: backend(persistence.Persistence)
+    """
+    global _persistence
+    if _persistence is None:
+        _persistence = persistence.FilePersistence("games")
+    return _persistence
+
+
+def set_persistence(backend):
+    """
+        Replace the backend saving game states, e.g. with
+        persistence.DisabledPersistence() or persistence.StreamPersistence("games.jsonl.gz")
+        return: the previous backend(persistence.Persistence or None)
+    """
+    global _persistence
+    previous, _persistence = _persistence, backend
+    return previous
+
+
+def save(game, backend=None):
+    (backend or get_persistence()).save(game)
+
+
+def compile_set_predicates(indexation):
+    """
+        Compile the INDEXATION rows into predicates on a card mask
+        (see shared.probabilities.cards). A set exists if the deal contains
+        all cards of card_mask and, for each (bits, count) requirement,
+        at least count of the cards in bits.
+        return: predicates(list of (card_mask, requirements) per action_id)
+    """
+    predicates = []
+    for set_row in indexation:
         set_type = set_row["set_type"]
         detail_1 = int(set_row["detail_1"]) if set_row["detail_1"] else None
         detail_2 = int(set_row["detail_2"]) if set_row["detail_2"] else None
-        card_values = [card["value"] for card in cards]
-        card_colours = [card["colour"] for card in cards]
+        card_mask = 0
+        requirements = []
 
         if set_type == "High card":
-            return card_values.count(detail_1) >= 1
+            requirements = [(VALUE_BITS[detail_1], 1)]
         elif set_type == "Pair":
-            return card_values.count(detail_1) >= 2
+            requirements = [(VALUE_BITS[detail_1], 2)]
         elif set_type == "Two pairs":
-            return card_values.count(detail_1) >= 2 and card_values.count(detail_2) >= 2
+            requirements = [(VALUE_BITS[detail_1], 2), (VALUE_BITS[detail_2], 2)]
         elif set_type == "Small straight":
-            return card_values.count(0) > 0 and card_values.count(1) > 0 and card_values.count(2) > 0 and card_values.count(3) > 0 and card_values.count(4) > 0
+            requirements = [(VALUE_BITS[value], 1) for value in mask_values(SMALL_STRAIGHT)]
         elif set_type == "Big straight":
-            return card_values.count(1) > 0 and card_values.count(2) > 0 and card_values.count(3) > 0 and card_values.count(4) > 0 and card_values.count(5) > 0
+            requirements = [(VALUE_BITS[value], 1) for value in mask_values(BIG_STRAIGHT)]
         elif set_type == "Great straight":
-            return card_values.count(0) > 0 and card_values.count(1) > 0 and card_values.count(2) > 0 and card_values.count(3) > 0 and card_values.count(4) > 0 and card_values.count(5) > 0
+            requirements = [(VALUE_BITS[value], 1) for value in mask_values(GREAT_STRAIGHT)]
         elif set_type == "Three of a kind":
-            return card_values.count(detail_1) >= 3
+            requirements = [(VALUE_BITS[detail_1], 3)]
         elif set_type == "Full house":
-            return card_values.count(detail_1) >= 3 and card_values.count(detail_2) >= 2
+            requirements = [(VALUE_BITS[detail_1], 3), (VALUE_BITS[detail_2], 2)]
         elif set_type == "Colour":
-            return card_colours.count(detail_1) >= 5
+            requirements = [(COLOUR_BITS[detail_1], 5)]
         elif set_type == "Four of a kind":
-            return card_values.count(detail_1) >= 4
+            requirements = [(VALUE_BITS[detail_1], 4)]
         elif set_type == "Small flush":
-            relevant_values = [card["value"] for card in cards if card["colour"] == detail_1]
-            if not relevant_values:
-                return False
-            return relevant_values.count(0) > 0 and relevant_values.count(1) > 0 and relevant_values.count(2) > 0 and relevant_values.count(3) > 0 and relevant_values.count(4) > 0
+            card_mask = sum(card_bit(value, detail_1) for value in mask_values(SMALL_STRAIGHT))
         elif set_type == "Big flush":
-            relevant_values = [card["value"] for card in cards if card["colour"] == detail_1]
-            if not relevant_values:
-                return False
-            return relevant_values.count(1) > 0 and relevant_values.count(2) > 0 and relevant_values.count(3) > 0 and relevant_values.count(4) > 0 and relevant_values.count(5) > 0
+            card_mask = sum(card_bit(value, detail_1) for value in mask_values(BIG_STRAIGHT))
         elif set_type == "Great flush":
-            relevant_values = [card["value"] for card in cards if card["colour"] == detail_1]
-            if not relevant_values:
-                return False
-            return relevant_values.count(0) > 0 and relevant_values.count(1) > 0 and relevant_values.count(2) > 0 and relevant_values.count(3) > 0 and relevant_values.count(4) > 0 and relevant_values.count(5) > 0
+            card_mask = sum(card_bit(value, detail_1) for value in mask_values(GREAT_STRAIGHT))
+        else:
+            raise ValueError(f"Unknown set type: {set_type}")
+
+        predicates.append((card_mask, tuple(requirements)))
+    return predicates
+
+
+def compile_set_arrays(predicates):
+    """
+        Convert the predicates into arrays for batch evaluation
+        return: required_cards(np.ndarray of int64, shape (88,)),
+                required_counts(np.ndarray of int8, shape (88, 10)) -
+                    minimal numbers of cards of each value, then of each colour
+    """
+    groups = VALUE_BITS + COLOUR_BITS
+    required_cards = np.array([card_mask for card_mask, _ in predicates], dtype=np.int64)
+    required_counts = np.zeros((len(predicates), len(groups)), dtype=np.int8)
+    for action_id, (_, requirements) in enumerate(predicates):
+        for bits, count in requirements:
+            required_counts[action_id, groups.index(bits)] = count
+    return required_cards, required_counts
+
+
+SET_PREDICATES = compile_set_predicates(INDEXATION)
+REQUIRED_CARDS, REQUIRED_COUNTS = compile_set_arrays(SET_PREDICATES)
+
+
+def hand_to_mask(cards):
+    """
+        Convert cards in the game schema ({"value", "colour"} dicts) into a card mask
+        return: mask(int)
+    """
+    mask = 0
+    for card in cards:
+        mask |= card_bit(card["value"], card["colour"])
+    return mask
+
 
+def set_exists(deal_mask, action_id):
+    """
+        Check whether the set of action_id exists in the cards of a card mask
+        return: exists(bool)
+    """
+    card_mask, requirements = SET_PREDICATES[action_id]
+    if deal_mask & card_mask != card_mask:
         return False
+    for bits, count in requirements:
+        if popcount(deal_mask & bits) < count:
+            return False
+    return True
+
+
+def determine_set_existence_batch(deal_masks):
+    """
+        Check the existence of all 88 sets in each of N deals at once
+        deal_masks: N card masks
+        return: exists(np.ndarray of bool, shape (N, 88))
+    """
+    deal_masks = np.asarray(deal_masks, dtype=np.int64).reshape(-1)
+    presence = masks_to_array(deal_masks)
+    counts = np.concatenate([presence.sum(axis=2), presence.sum(axis=1)], axis=1)
+    exists = (deal_masks[:, None] & REQUIRED_CARDS) == REQUIRED_CARDS
+    for group in range(N_VALUES + N_COLOURS):
+        exists &= counts[:, group, None] >= REQUIRED_COUNTS[:, group]
+    return exists
+
+
+def set_exists_batch(deal_masks, action_ids):
+    """
+        Check the existence of one set per deal, for N deals at once
+        deal_masks: N card masks
+        action_ids: N action ids (0-87)
+        return: exists(np.ndarray of bool, shape (N,))
+    """
+    deal_masks = np.asarray(deal_masks, dtype=np.int64).reshape(-1)
+    action_ids = np.asarray(action_ids, dtype=np.intp).reshape(-1)
+    presence = masks_to_array(deal_masks)
+    counts = np.concatenate([presence.sum(axis=2), presence.sum(axis=1)], axis=1)
+    required_cards = REQUIRED_CARDS[action_ids]
+    exists = (deal_masks & required_cards) == required_cards
+    return exists & np.all(counts >= REQUIRED_COUNTS[action_ids], axis=1)
+
 
+def determine_set_existence(cards, action_id):
+    try:
+        return set_exists(hand_to_mask(cards), int(action_id))
     except Exception as err:
         raise type(err)(f"{err} \n Failed in determine_set_existence")
 
 
-def draw_cards(players):
-    possible_cards = product(range(6), range(4))
-    all_cards_raw = sample(list(possible_cards), sum(int(p["n_cards"]) for p in players))
-    all_cards = [{"value": tup[0], "colour": tup[1]} for tup in all_cards_raw]
-    card_iterator = iter(all_cards)
+# Dealer of games without their own, used by draw_hand_masks / draw_cards
+_dealer = None
+
+
+def get_dealer():
+    global _dealer
+    if _dealer is None:
+        _dealer = Dealer()
+    return _dealer
+
+
+def draw_hand_masks(n_cards, dealer=None):
+    """
+        Deal random cards to players with n_cards[i] cards each
+        dealer: Dealer of the game, the shared unseeded one by default
+        return: hand_masks(list of card masks)
+    """
+    return (dealer or get_dealer()).deal(n_cards)
+
+
+def draw_cards(players, dealer=None):
+    hand_masks = draw_hand_masks([int(p["n_cards"]) for p in players], dealer)
     hands = []
-    for player in players:
-        player_hand = list(islice(card_iterator, 0, int(player["n_cards"])))
+    for player, hand_mask in zip(players, hand_masks):
+        player_hand = [{"value": value, "colour": colour} for value, colour in mask_to_cards(hand_mask)]
         hands.append({"nickname": player['nickname'], "hand": player_hand})
     return hands
 
@@ -214,86 +337,138 @@ def arrange_players(players):
 
     return players
 
-def create_game(n_agents, verbose=False):
+def create_game(n_agents, verbose=False, seed=None, nicknames=None, game_uuid=None):
+    """
+        Start a game between n_agents players
+        seed: seeds the game's dealer, so the deals are reproducible
+        nicknames: of the players in the order of play, "0", "1", ... by default
+        return: game(GameState)
+    """
     if n_agents < 2:
         raise ValueError("n_agents < 2")
-    game_uuid = str(uuid.uuid4())
-    players = [{"nickname": str(i), "n_cards": 1} for i in range(n_agents)]
-    return {
-        "game_uuid": game_uuid,
-        "status": "Running",
-        "round_number": 1,
-        "max_cards": floor(24 / n_players) if len(players) > 2 else 11,
-        "hands": draw_cards(players),
-        "players": players,
-        "cp_nickname": players[0]["nickname"],
-        "history": []
-    }
-
-
-def get_player_by_nickname(players, nickname):
-    filtered_players = [p for p in players if p["nickname"] == nickname]
-    if filtered_players:
-        return filtered_players[0]
-
-
-def find_next_active_player(players, cp_nickname):
-    active_players = [player for player in players if player["n_cards"] != 0 or player["nickname"] == cp_nickname]
-    current_player_order = [i for i, player in enumerate(active_players) if player["nickname"] == cp_nickname][0]
-    next_active_player = (active_players * 2)[current_player_order + 1]
-    return next_active_player
-
-
-def handle_check(game):
-    cp_nickname = game["cp_nickname"]
-    cards = [card for hand in game["hands"] for card in hand["hand"]]
-    set_exists = determine_set_existence(cards, game["history"][-2]["action_id"])
-    if set_exists:
-        losing_player = get_player_by_nickname(game["players"], game["history"][-1]["player"])
-    else:
-        losing_player = get_player_by_nickname(game["players"], game["history"][-2]["player"])
-
-    game["history"].append({"player": losing_player["nickname"], "action_id": 89})
-    game["cp_nickname"] = None
+    if nicknames is not None and len(nicknames) != n_agents:
+        raise ValueError("Expected {} nicknames, got {}".format(n_agents, len(nicknames)))
+    game = GameState(game_uuid if game_uuid is not None else str(uuid.uuid4()),
+                     nicknames=nicknames if nicknames is not None else [str(i) for i in range(n_agents)],
+                     n_cards=[1] * n_agents,
+                     max_cards=floor(24 / n_agents) if n_agents > 2 else 11)
+    game.dealer = Dealer(seed)
+    game.hand_masks = draw_hand_masks(game.n_cards, game.dealer)
+    return game
+
+
+def find_loser(game):
+    """
+        return: the player losing the round which game.history ends with a check of(int)
+    """
+    checked_player, checked_action_id = game.history[-2]
+    if set_exists(game.deal_mask(), checked_action_id):
+        return game.history[-1][0]
+    return checked_player
 
-    # Store the last round separately
-    save(game)
 
-    losing_player["n_cards"] += 1
+def next_round(game, losing_player, checking_player):
+    """
+        Give losing_player a card, eliminate them if they surpass max cards,
+        then either finish the game or deal the next round
+    """
+    game.unshare()
+    game.n_cards[losing_player] += 1
     # If a player surpasses max cards, make them inactive (set their n_cards to 0) and either finish the game or set up next round
-    if losing_player["n_cards"] > game["max_cards"]:
-        losing_player["n_cards"] = 0
+    if game.n_cards[losing_player] > game.max_cards:
+        game.n_cards[losing_player] = 0
+        game.eliminate(losing_player)
         # Check if game is finished
-        if sum(p["n_cards"] > 0 for p in game["players"]) == 1:
-            game["status"] = "Finished"
+        if game.n_active == 1:
+            game.status = "Finished"
         else:
             # If the checking player was eliminated, figure out the next player
             # Otherwise the current player doesn't change
-            if losing_player["nickname"] == cp_nickname:
-                game["cp_nickname"] = find_next_active_player(game["players"], cp_nickname)["nickname"]
+            if losing_player == checking_player:
+                game.cp = game.next_active[checking_player]
             else:
-                game["cp_nickname"] = cp_nickname
+                game.cp = checking_player
     else:
         # If no one is kicked out, picking the next player is easier
-        game["cp_nickname"] = losing_player["nickname"]
+        game.cp = losing_player
+
+    game.round_number += 1
+    game.history = []
+    game.hand_masks = draw_hand_masks(game.n_cards, game.dealer)
+
+
+def handle_check(game, backend=None):
+    cp = game.cp
+    losing_player = find_loser(game)
+
+    game.history.append((losing_player, 89))
+    game.cp = None
+
+    # Store the last round separately
+    save(game, backend)
 
-    game["round_number"] += 1
-    game["history"] = []
-    game["hands"] = draw_cards(game["players"])
+    next_round(game, losing_player, cp)
 
-    save(game)
+    save(game, backend)
 
 
-def play(game, action_id, verbose=False):
-    game["history"].append({"player": game["cp_nickname"], "action_id": action_id})
+def play(game, action_id, verbose=False, backend=None):
+    """
+        Play action_id as the current player of game (a GameState)
+        backend: saves the game states, the one of get_persistence by default
+    """
+    game.history.append((game.cp, action_id))
 
     if action_id != 88:
         move_name = INDEXATION[action_id]['set_type']
         if verbose:
-            print(f"player {game['cp_nickname']} plays {move_name}")
-        game["cp_nickname"] = find_next_active_player(game["players"], game["cp_nickname"])["nickname"]
+            print(f"player {game.cp_nickname} plays {move_name}")
+        game.cp = game.next_active[game.cp]
 
     if action_id == 88:
         if verbose:
-            print(f"player {game['cp_nickname']} checks")
-        handle_check(game)
+            print(f"player {game.cp_nickname} checks")
+        handle_check(game, backend)
+
+
+def apply(game, action_id):
+    """
+        Play action_id as the current player of game (a GameState), like play
+        but without saving, so that undo can take it back.
+        A check ends the round and deals the next one from game.dealer.
+    """
+    if action_id != CHECK:
+        game.history.append((game.cp, action_id))
+        game.cp = game.next_active[game.cp]
+        game.undo_stack.append(None)
+        return
+    cp = game.cp
+    game.history.append((cp, action_id))
+    losing_player = find_loser(game)
+    game.history.append((losing_player, 89))
+    game.undo_stack.append((cp, losing_player, game.history, game.hand_masks, game.status))
+    game.cp = None
+    next_round(game, losing_player, cp)
+
+
+def undo(game):
+    """
+        Take back the last action played with apply
+    """
+    record = game.undo_stack.pop()
+    if record is None:
+        game.cp = game.history.pop()[0]
+        return
+    cp, losing_player, history, hand_masks, status = record
+    game.unshare()
+    if game.n_cards[losing_player] == 0:
+        game.n_cards[losing_player] = game.max_cards
+        game.restore(losing_player)
+    else:
+        game.n_cards[losing_player] -= 1
+    game.status = status
+    game.round_number -= 1
+    # Drop the loser and the check
+    game.history = history[:-2]
+    game.hand_masks = hand_masks
+    game.cp = cp
@@ -0,0 +1,133 @@
+import random
+import asyncio
+from time import sleep, monotonic
+
+
+def state_version(game_state):
+    """
+        What changes in a game state when anyone acts
+        return: version(tuple) - status, round_number, history length
+    """
+    return (game_state.get("status"), game_state.get("round_number"), len(game_state.get("history") or []))
+
+
+class Backoff(object):
+    """
+        Exponential backoff with jitter: delays grow from initial to maximum
+        by factor, each picked at random from the upper half of its range
+    """
+
+    def __init__(self, initial=0.05, maximum=2.0, factor=2.0):
+        super(Backoff, self).__init__()
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempt = 0
+        # Own generator, so that seeding the random module isn't affected
+        self.random = random.Random()
+
+    def reset(self):
+        self.attempt = 0
+
+    def next_delay(self):
+        """
+            return: seconds to wait(float)
+        """
+        delay = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay / 2 + self.random.uniform(0, delay / 2)
+
+
+class StateWatcher(object):
+    """
+        Watches the game state of a GameManager on behalf of the player nickname,
+        returning only when it's their turn or when the game is over.
+        Fetches back off exponentially while nothing changes, and start again
+        from the initial delay as soon as the game state changes.
+        If long_poll, fetches ask the engine to wait up to long_poll seconds for a
+        change (see BaseGameManager.game_state_url) - engines without long polling
+        answer at once and the watcher falls back on backing off, as it does
+        whenever a long poll comes back unchanged before long_poll seconds.
+        Works with GameManager (wait_for_turn) and AsyncGameManager (wait_for_turn_async).
+    """
+
+    def __init__(self, game_manager, nickname, backoff=None, long_poll=None):
+        super(StateWatcher, self).__init__()
+        self.game_manager = game_manager
+        self.nickname = nickname
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.long_poll = long_poll
+        self.version = None
+        self.game_state = None
+        # Version of the last state returned as this player's turn
+        self.turn_version = None
+        self.long_poll_supported = False
+
+    def forget_turn(self):
+        """
+            Return the last turn again, e.g. if playing it failed
+        """
+        self.turn_version = None
+
+    def fetch_arguments(self):
+        if self.long_poll and self.version is not None:
+            return {"version": self.version, "wait": self.long_poll}
+        return {}
+
+    def update(self, succeeded, game_state, elapsed=None):
+        """
+            Handle a fetched game state
+            elapsed: seconds the fetch took
+            return: game_state to return(dict or None), seconds to wait before the next fetch(float)
+        """
+        if not succeeded:
+            return None, self.backoff.next_delay()
+        # Whether the engine held the fetch for the whole long poll
+        held = elapsed is None or not self.long_poll or elapsed >= self.long_poll
+        if game_state is None:
+            # Nothing changed during the long poll
+            self.long_poll_supported = True
+            return None, 0.0 if held else self.backoff.next_delay()
+        version = state_version(game_state)
+        changed = version != self.version
+        if changed:
+            self.version = version
+            self.game_state = game_state
+            self.backoff.reset()
+        if game_state.get("status") not in ("Running", "Not started"):
+            return game_state, 0.0
+        if game_state.get("status") == "Running" and game_state.get("cp_nickname") == self.nickname \
+                and version != self.turn_version:
+            self.turn_version = version
+            return game_state, 0.0
+        if self.long_poll_supported and self.fetch_arguments() and (changed or held):
+            return None, 0.0
+        return None, self.backoff.next_delay()
+
+    def wait_for_turn(self):
+        """
+            Block until it's this player's turn or the game is over
+            return: game_state(dict)
+        """
+        while True:
+            t0 = monotonic()
+            succeeded, game_state = self.game_manager.get_game_state(**self.fetch_arguments())
+            game_state, delay = self.update(succeeded, game_state, monotonic() - t0)
+            if game_state is not None:
+                return game_state
+            if delay:
+                sleep(delay)
+
+    async def wait_for_turn_async(self):
+        """
+            asyncio version of wait_for_turn
+            return: game_state(dict)
+        """
+        while True:
+            t0 = monotonic()
+            succeeded, game_state = await self.game_manager.get_game_state(**self.fetch_arguments())
+            game_state, delay = self.update(succeeded, game_state, monotonic() - t0)
+            if game_state is not None:
+                return game_state
+            if delay:
+                await asyncio.sleep(delay)
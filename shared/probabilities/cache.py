@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+
+# First action id of each group of colour-specific bets (one bet per colour):
+# colour, small flush, big flush, great flush
+COLOUR_BET_OFFSETS = (66, 76, 80, 84)
+
+
+def hand_signature(cards):
+    """
+        Compute a canonical signature of a hand, invariant under
+        permuting the four colours.
+        Each colour is represented by a 6-bit mask of the values held in it,
+        and the colour masks are sorted in descending order.
+        return: signature(tuple of 4 ints) or None if the hand is not a set of valid cards,
+                colour_order(list) - colour_order[i] is the original colour of canonical colour i
+    """
+    masks = [0, 0, 0, 0]
+    for value, colour in cards:
+        if value not in range(6) or colour not in range(4) or masks[colour] >> value & 1:
+            return None, None
+        masks[colour] |= 1 << value
+    colour_order = sorted(range(4), key=lambda colour: masks[colour], reverse=True)
+    return tuple(masks[colour] for colour in colour_order), colour_order
+
+
+def permute_colours(bet_probs, colour_order):
+    """
+        Map a probability vector of the canonical hand back onto the original colours
+        return: bet_probs(list)
+    """
+    permuted = list(bet_probs)
+    for canonical_colour, colour in enumerate(colour_order):
+        for offset in COLOUR_BET_OFFSETS:
+            permuted[offset + colour] = bet_probs[offset + canonical_colour]
+    return permuted
+
+
+class LRUCache(object):
+    """Thread-safe, size-bounded cache with least-recently-used eviction and hit/miss counters"""
+
+    def __init__(self, maxsize=4096):
+        super(LRUCache, self).__init__()
+        if not isinstance(maxsize, int) or maxsize < 1:
+            raise ValueError("maxsize must be a positive integer")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def get(self, key, default=None):
+        with self.__lock:
+            try:
+                value = self.__data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.__data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.__lock:
+            self.__data[key] = value
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+            return: cache statistics(dict)
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.__data), "maxsize": self.maxsize}
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+N_VALUES = 6
+N_COLOURS = 4
+
+# Number of set bits of every 6-bit number
+POPCOUNT = tuple(bin(i).count("1") for i in range(1 << N_VALUES))
+# Bits of a card mask belonging to each value / colour
+VALUE_BITS = tuple(0xF << (N_COLOURS * value) for value in range(N_VALUES))
+COLOUR_BITS = tuple(sum(1 << (N_COLOURS * value + colour) for value in range(N_VALUES)) for colour in range(N_COLOURS))
+# 6-bit value masks of the straights and flushes
+SMALL_STRAIGHT = 0b011111
+BIG_STRAIGHT = 0b111110
+GREAT_STRAIGHT = 0b111111
+
+
+def popcount(mask):
+    """
+        return: number of cards in a card mask(int)
+    """
+    return bin(mask).count("1")
+
+
+def mask_values(value_mask):
+    """
+        return: the values in a 6-bit value mask(list of int, sorted)
+    """
+    return [value for value in range(N_VALUES) if value_mask >> value & 1]
+
+
+def card_bit(value, colour):
+    """
+        return: the bit of a card in a card mask(int)
+    """
+    return 1 << (N_COLOURS * value + colour)
+
+
+def cards_to_mask(cards):
+    """
+        Convert (value, colour) tuples into a 24-bit card mask,
+        where the card (value, colour) is bit 4*value + colour
+        return: mask(int)
+    """
+    mask = 0
+    for value, colour in cards:
+        mask |= 1 << (N_COLOURS * value + colour)
+    return mask
+
+
+def mask_to_cards(mask):
+    """
+        return: cards(list of (value, colour) tuples, sorted)
+    """
+    return [(value, colour) for value in range(N_VALUES) for colour in range(N_COLOURS)
+            if mask >> (N_COLOURS * value + colour) & 1]
+
+
+def masks_to_array(masks):
+    """
+        Convert N card masks into a card presence array
+        return: presence(np.ndarray of bool, shape (N, 6, 4))
+    """
+    masks = np.asarray(masks, dtype=np.int64).reshape(-1, 1)
+    bits = (masks >> np.arange(N_VALUES * N_COLOURS, dtype=np.int64)) & 1
+    return bits.astype(bool).reshape(-1, N_VALUES, N_COLOURS)
+
+
+class Cards(object):
+    """
+        A class for compact card information storage.
+        The hand is a 24-bit mask (see cards_to_mask) and per-value/per-colour
+        counts and masks are computed once, on construction.
+    """
+
+    __slots__ = ("mask", "size", "value_counts", "colour_counts", "value_mask", "colour_masks")
+
+    def __init__(self, cards=()):
+        super(Cards, self).__init__()
+        colour_masks = [0] * N_COLOURS
+        for value, colour in cards:
+            if colour_masks[colour] >> value & 1:
+                raise ValueError("Duplicate card: {}".format((value, colour)))
+            colour_masks[colour] |= 1 << value
+        self.set_colour_masks(colour_masks)
+
+    @classmethod
+    def from_colour_masks(cls, colour_masks):
+        """
+            Build Cards from 4 masks of the values held in each colour
+        """
+        cards = cls.__new__(cls)
+        cards.set_colour_masks(colour_masks)
+        return cards
+
+    @classmethod
+    def from_mask(cls, mask):
+        """
+            Build Cards from a 24-bit card mask
+        """
+        colour_masks = [0] * N_COLOURS
+        for value in range(N_VALUES):
+            for colour in range(N_COLOURS):
+                if mask >> (N_COLOURS * value + colour) & 1:
+                    colour_masks[colour] |= 1 << value
+        return cls.from_colour_masks(colour_masks)
+
+    def set_colour_masks(self, colour_masks):
+        # colour_masks[colour] - 6-bit mask of the values held in that colour
+        self.colour_masks = tuple(colour_masks)
+        self.colour_counts = tuple(POPCOUNT[colour_mask] for colour_mask in colour_masks)
+        self.mask = 0
+        for colour, colour_mask in enumerate(colour_masks):
+            for value in range(N_VALUES):
+                if colour_mask >> value & 1:
+                    self.mask |= 1 << (N_COLOURS * value + colour)
+        self.value_counts = tuple(POPCOUNT[(self.mask & VALUE_BITS[value]) >> (N_COLOURS * value)] for value in range(N_VALUES))
+        # 6-bit mask of the values held in any colour
+        self.value_mask = colour_masks[0] | colour_masks[1] | colour_masks[2] | colour_masks[3]
+        self.size = sum(self.colour_counts)
+
+    def __getitem__(self, index):
+        return mask_to_cards(self.mask)[index]
+
+    def __iter__(self):
+        return iter(mask_to_cards(self.mask))
+
+    def __len__(self):
+        return self.size
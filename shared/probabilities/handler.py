@@ -1,281 +1,451 @@
-import itertools
-from collections import defaultdict
+import threading
+import numpy as np
 from shared.probabilities import probability_table as pt
-
-
-class Cards(object):
-    """A class for card information storage."""
-
-    def __init__(self, cards):
-        super(Cards, self).__init__()
-        cards = sorted(cards) # itertools.groupby won't work if cards not sorted
-        self.__raw = cards
-        self.values = set(list(zip(*cards))[0]) if cards else set([])
-        self.colours = set(list(zip(*cards))[1]) if cards else set([])
-        # Group cards by colour and value
-        self.with_value = self.group_cards(cards, by="value")
-        self.with_colour = self.group_cards(cards, by="colour")
-
-    def __getitem__(self, index):
-        return self.__raw[index]
-
-    def __len__(self):
-         return len(self.__raw)
-
-    @staticmethod
-    def group_cards(cards, by="value"):
-        if by == "value":
-            with_value = defaultdict(list)
-            for value, grouped_cards in itertools.groupby(cards, lambda x: x[0]):
-                with_value[value].extend(list(grouped_cards))
-            return with_value
-        if by == "colour":
-            with_colour = defaultdict(list)
-            for colour, grouped_cards in itertools.groupby(cards, lambda x: x[1]):
-                with_colour[colour].extend(list(grouped_cards))
-            return with_colour
-        raise ValueError("'by' needs to be either 'value' or 'colour'")
+from shared.probabilities.cards import Cards, POPCOUNT, cards_to_mask, masks_to_array
+from shared.probabilities.cache import LRUCache, hand_signature, permute_colours
+
+
+def build_action_columns():
+    """
+        Build the lookup used by Handler.get_probability_matrix:
+        ACTION_COLUMNS[action_id, state] is the probability table column
+        for a bet, given the state (the relevant card counts) of a hand.
+        Column SURE is a probability of 1.0 (the hand already contains the set).
+        The mapping mirrors the Handler.get_*_prob methods.
+    """
+    B = pt.BetType
+    highcard = [B.HIGHCARD, SURE]
+    pair = [B.PAIR, B.PAIR_HAVE_1, SURE]
+    # state = 3 * min(value_1_num, 2) + min(value_2_num, 2)
+    twopairs = [B.TWOPAIRS, B.TWOPAIRS_HAVE_1, B.PAIR,
+                B.TWOPAIRS_HAVE_1, B.TWOPAIRS_HAVE_1_HAVE_1, B.PAIR_HAVE_1,
+                B.PAIR, B.PAIR_HAVE_1, SURE]
+    straight = [B.STRAIGHT, B.STRAIGHT_HAVE_1, B.STRAIGHT_HAVE_2, B.STRAIGHT_HAVE_3, B.STRAIGHT_HAVE_4, SURE]
+    great_straight = [B.GREAT_STRAIGHT] + straight
+    three = [B.THREE, B.THREE_HAVE_1, B.THREE_HAVE_2, SURE]
+    # state = 5 * min(value_1_num, 3) + value_2_num
+    fullhouse = [B.FULLHOUSE, B.FULLHOUSE_HAVE_0_AND_1, B.THREE, B.FULLHOUSE, B.FULLHOUSE,
+                 B.FULLHOUSE_HAVE_1_AND_0, B.FULLHOUSE_HAVE_1_AND_1, B.THREE_HAVE_1, B.FULLHOUSE, B.FULLHOUSE,
+                 B.FULLHOUSE_HAVE_2_AND_0, B.FULLHOUSE_HAVE_2_AND_1, B.THREE_HAVE_2, B.FULLHOUSE, B.FULLHOUSE,
+                 B.PAIR, B.PAIR_HAVE_1, SURE, SURE, SURE]
+    colour = [B.COLOUR, B.COLOUR_HAVE_1, B.COLOUR_HAVE_2, B.COLOUR_HAVE_3, B.COLOUR_HAVE_4, SURE]
+    four = [B.FOUR, B.FOUR_HAVE_1, B.FOUR_HAVE_2, B.FOUR_HAVE_3, SURE]
+    flush = [B.FLUSH, B.FOUR_HAVE_1, B.FLUSH_HAVE_2, B.FOUR_HAVE_3, B.FLUSH_HAVE_4, SURE]
+    great_flush = [B.FLUSH_GREAT] + flush
+
+    groups = [(range(0, 6), highcard), (range(6, 12), pair), (range(12, 27), twopairs),
+              (range(27, 29), straight), (range(29, 30), great_straight), (range(30, 36), three),
+              (range(36, 66), fullhouse), (range(66, 70), colour), (range(70, 76), four),
+              (range(76, 84), flush), (range(84, 88), great_flush)]
+    action_columns = np.full((88, max(len(columns) for _, columns in groups)), SURE, dtype=np.intp)
+    for action_ids, columns in groups:
+        action_columns[action_ids.start:action_ids.stop, :len(columns)] = columns
+    return action_columns
+
+
+# Extra column of the probability table row, holding a probability of 1.0
+SURE = pt.N_BET_TYPES
+ACTION_COLUMNS = build_action_columns()
+# (value_1, value_2) of the two pairs (12-26) and full house (36-65) bets
+TWOPAIRS_VALUES = np.array([(1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (3, 2), (4, 0), (4, 1), (4, 2), (4, 3), (5, 0), (5, 1), (5, 2), (5, 3), (5, 4)])
+FULLHOUSE_VALUES = np.array([(v1, v2) for v1 in range(6) for v2 in range(6) if v1 != v2])
+
+
+def hands_to_array(hands):
+    """
+        Convert hands into a card presence array
+        hands: iterable of N hands (Cards or iterables of (value, colour) tuples)
+        return: presence(np.ndarray of bool, shape (N, 6, 4))
+    """
+    masks = [cards.mask if isinstance(cards, Cards) else cards_to_mask(cards) for cards in hands]
+    return masks_to_array(np.array(masks, dtype=np.int64))
 
 
 class Handler(object):
     """Handler class for managing bet probability retrieval"""
 
-    def __init__(self):
+    def __init__(self, cache_size=4096, probs_table=None):
         super(Handler, self).__init__()
-        self.probs_table = pt.get()
-        # Validate probs_table - check header for all bet types
-        bet_types = [getattr(pt.BetType, attr) for attr in dir(pt.BetType) if not callable(getattr(pt.BetType, attr)) and not attr.startswith("__")]
-        if not all(bet_type in self.probs_table[index] for index in self.probs_table for bet_type in bet_types):
-            raise ValueError("The probability table is corrupted! Consider deleting the CSV.")
+        # Probability vectors keyed by (canonical hand signature, others_card_num); cache_size=0 disables it
+        self.cache = LRUCache(cache_size) if cache_size else None
+        # Loaded on the first probability query, see probs_table
+        self._probs_table = None
+        if probs_table is not None:
+            self.set_probs_table(probs_table)
         self.card_values_for_bet = {0: [0], 1: [1], 2: [2], 3: [3], 4: [4], 5: [5], 6: [0], 7: [1], 8: [2], 9: [3], 10: [4], 11: [5], 12: [0, 1], 13: [0, 2], 14: [1, 2], 15: [0, 3], 16: [1, 3], 17: [2, 3], 18: [0, 4], 19: [1, 4], 20: [2, 4], 21: [3, 4], 22: [0, 5], 23: [1, 5], 24: [2, 5], 25: [3, 5], 26: [4, 5], 27: [0, 1, 2, 3, 4], 28: [1, 2, 3, 4, 5], 29: [0, 1, 2, 3, 4, 5], 30: [0], 31: [1], 32: [2], 33: [3], 34: [4], 35: [5], 36: [0, 1], 37: [0, 2], 38: [0, 3], 39: [0, 4], 40: [0, 5], 41: [1, 0], 42: [1, 2], 43: [1, 3], 44: [1, 4], 45: [1, 5], 46: [2, 0], 47: [2, 1], 48: [2, 3], 49: [2, 4], 50: [2, 5], 51: [3, 0], 52: [3, 1], 53: [3, 2], 54: [3, 4], 55: [3, 5], 56: [4, 0], 57: [4, 1], 58: [4, 2], 59: [4, 3], 60: [4, 5], 61: [5, 0], 62: [5, 1], 63: [5, 2], 64: [5, 3], 65: [5, 4], 70: [0], 71: [1], 72: [2], 73: [3], 74: [4], 75: [5], 76: [0, 1, 2, 3, 4], 77: [0, 1, 2, 3, 4], 78: [0, 1, 2, 3, 4], 79: [0, 1, 2, 3, 4], 80: [1, 2, 3, 4, 5], 81: [1, 2, 3, 4, 5], 82: [1, 2, 3, 4, 5], 83: [1, 2, 3, 4, 5], 84: [0, 1, 2, 3, 4, 5], 85: [0, 1, 2, 3, 4, 5], 86: [0, 1, 2, 3, 4, 5], 87: [0, 1, 2, 3, 4, 5]}
+        # 6-bit masks of card_values_for_bet, for counting held values with POPCOUNT
+        self.value_mask_for_bet = {action_id: sum(1 << value for value in values) for action_id, values in self.card_values_for_bet.items()}
         self.card_colour_for_bet = {66: 0, 67: 1, 68: 2, 69: 3, 76: 0, 77: 1, 78: 2, 79: 3, 80: 0, 81: 1, 82: 2, 83: 3, 84: 0, 85: 1, 86: 2, 87: 3}
 
+    @property
+    def probs_table(self):
+        """
+            The probability table, loaded lazily - constructing a Handler is cheap
+        """
+        if self._probs_table is None:
+            self.set_probs_table(pt.get())
+        return self._probs_table
+
+    def set_probs_table(self, probs_table):
+        # Validate probs_table - check shape and every probability of every valid row
+        if not pt.validate(probs_table):
+            raise ValueError("The probability table is corrupted! Consider regenerating it.")
+        # The table is shared by every caller of this handler - keep it read-only,
+        # through a view, so that the caller's array is left as it was
+        probs_table = probs_table.view()
+        probs_table.setflags(write=False)
+        self._probs_table = probs_table
+
+    def __getstate__(self):
+        """
+            Pickle a memory-mapped table by its filename (e.g. when passing agents
+            to worker processes), so that the worker attaches to the same file
+            instead of receiving a private copy. The cache is not pickled.
+        """
+        state = self.__dict__.copy()
+        if isinstance(self._probs_table, np.memmap) and self._probs_table.filename:
+            state["_probs_table"] = None
+            state["probs_table_filename"] = self._probs_table.filename
+        state["cache"] = self.cache.maxsize if self.cache is not None else None
+        return state
+
+    def __setstate__(self, state):
+        probs_table_filename = state.pop("probs_table_filename", None)
+        if probs_table_filename is not None:
+            state["_probs_table"] = pt.load_mmap(probs_table_filename)
+        state["cache"] = LRUCache(state["cache"]) if state["cache"] else None
+        self.__dict__.update(state)
+
     def get_probability_vector(self, cards=None, others_card_num=0):
+        """
+            Compute the probability of every bet (action ids 0-87),
+            given the player's cards and the number of cards of other players.
+            Doesn't modify the handler (apart from its thread-safe cache),
+            so one Handler can serve many threads.
+            return: bet_probs(list of 88 floats)
+        """
         if cards is None:
             raise TypeError("No 'cards' provided.")
         if not all(len(c) == 2 and all(isinstance(val, int) for val in c) for c in cards):
             raise TypeError("'cards' is not an iterable of integer tuples")
-        self.cards = Cards(cards)
-
         if others_card_num <= 0 or (others_card_num + len(cards)) > 24:
             raise ValueError("Invalid 'others_card_num' provided")
-        self.others_card_num = others_card_num
-        return [self.get_bet_prob(i) for i in range(88)]
-
-    def get_table_value(self, column):
-        index = len(self.cards)*100 + self.others_card_num
-        return self.probs_table[index][column]
 
-    def get_bet_prob(self, action_id):
+        if self.cache is not None:
+            signature, colour_order = hand_signature(cards)
+            if signature is not None:
+                # The vector only depends on the hand up to a permutation of colours
+                key = (signature, others_card_num)
+                bet_probs = self.cache.get(key)
+                if bet_probs is None:
+                    bet_probs = tuple(self.compute_probability_vector(Cards.from_colour_masks(signature), others_card_num))
+                    self.cache.put(key, bet_probs)
+                return permute_colours(bet_probs, colour_order)
+        return self.compute_probability_vector(Cards(cards), others_card_num)
+
+    def compute_probability_vector(self, cards, others_card_num):
+        """
+            Compute the probability vector without validation or caching
+            cards: Cards or an iterable of (value, colour) tuples
+            return: bet_probs(list of 88 floats)
+        """
+        if not isinstance(cards, Cards):
+            cards = Cards(cards)
+        row = self.get_table_row(len(cards), others_card_num)
+        return [self.get_bet_prob(i, cards, row) for i in range(88)]
+
+    def get_table_row(self, card_num, others_card_num):
+        """
+            Get the probabilities of all bet types (indexed by BetType)
+            for a player with card_num cards against others_card_num cards
+        """
+        return self.probs_table[card_num, others_card_num]
+
+    def get_probability_matrix(self, hands, others_card_nums):
+        """
+            Batch version of get_probability_vector.
+            hands: iterable of N hands (Cards or iterables of (value, colour) tuples),
+                   an array of N card masks or a card presence array of shape (N, 6, 4)
+            others_card_nums: N numbers of cards of other players
+            return: bet_probs(np.ndarray of float64, shape (N, 88))
+        """
+        if isinstance(hands, np.ndarray):
+            presence = masks_to_array(hands) if hands.ndim == 1 else hands.astype(bool, copy=False)
+        else:
+            presence = hands_to_array(hands)
+        others_card_nums = np.asarray(others_card_nums, dtype=np.intp).reshape(-1)
+        if presence.ndim != 3 or presence.shape[1:] != (6, 4):
+            raise TypeError("'hands' must be a list of hands or an array of shape (N, 6, 4)")
+        if len(presence) != len(others_card_nums):
+            raise ValueError("'hands' and 'others_card_nums' must have equal length")
+
+        value_nums = presence.sum(axis=2)
+        colour_nums = presence.sum(axis=1)
+        card_nums = value_nums.sum(axis=1)
+        if np.any(others_card_nums <= 0) or np.any(card_nums + others_card_nums > 24) or np.any(card_nums >= pt.MAX_PLAYER_CARDS):
+            raise ValueError("Invalid 'others_card_nums' provided")
+
+        # The state of each bet - the card counts relevant to it, see build_action_columns
+        has_value = value_nums > 0
+        states = np.empty((len(presence), 88), dtype=np.intp)
+        states[:, 0:6] = has_value
+        states[:, 6:12] = np.minimum(value_nums, 2)
+        states[:, 12:27] = 3 * np.minimum(value_nums[:, TWOPAIRS_VALUES[:, 0]], 2) + np.minimum(value_nums[:, TWOPAIRS_VALUES[:, 1]], 2)
+        states[:, 27] = has_value[:, 0:5].sum(axis=1)
+        states[:, 28] = has_value[:, 1:6].sum(axis=1)
+        states[:, 29] = has_value.sum(axis=1)
+        states[:, 30:36] = np.minimum(value_nums, 3)
+        states[:, 36:66] = 5 * np.minimum(value_nums[:, FULLHOUSE_VALUES[:, 0]], 3) + value_nums[:, FULLHOUSE_VALUES[:, 1]]
+        states[:, 66:70] = np.minimum(colour_nums, 5)
+        states[:, 70:76] = value_nums
+        states[:, 76:80] = presence[:, 0:5].sum(axis=1)
+        states[:, 80:84] = presence[:, 1:6].sum(axis=1)
+        states[:, 84:88] = colour_nums
+
+        rows = np.ones((len(presence), SURE + 1))
+        rows[:, :SURE] = self.probs_table[card_nums, others_card_nums]
+        return np.take_along_axis(rows, ACTION_COLUMNS[np.arange(88), states], axis=1)
+
+    def get_bet_prob(self, action_id, cards, row):
         try:
             action_id = int(action_id)
         except (ValueError, TypeError) as e:
             raise e("action_id is not valid: {}".format(action_id))
 
         if action_id in range(6):
-            return self.get_highcard_prob(action_id)
+            return self.get_highcard_prob(action_id, cards, row)
 
         elif action_id in range(6, 12):
-            return self.get_pair_prob(action_id)
+            return self.get_pair_prob(action_id, cards, row)
 
         elif action_id in range(12, 27):
-            return self.get_twopairs_prob(action_id)
+            return self.get_twopairs_prob(action_id, cards, row)
 
         elif action_id in {27, 28}:
-            return self.get_straight_prob(action_id)
+            return self.get_straight_prob(action_id, cards, row)
 
         elif action_id == 29:
-            return self.get_great_straight_prob()
+            return self.get_great_straight_prob(cards, row)
 
         elif action_id in range(30, 36):
-            return self.get_three_prob(action_id)
+            return self.get_three_prob(action_id, cards, row)
 
         elif action_id in range(36, 66):
-            return self.get_fullhouse_prob(action_id)
+            return self.get_fullhouse_prob(action_id, cards, row)
 
         elif action_id in range(66, 70):
-            return self.get_colour_prob(action_id)
+            return self.get_colour_prob(action_id, cards, row)
 
         elif action_id in range(70, 76):
-            return self.get_four_prob(action_id)
+            return self.get_four_prob(action_id, cards, row)
 
         elif action_id in range(76, 84):
-            return self.get_flush_prob(action_id)
+            return self.get_flush_prob(action_id, cards, row)
 
         elif action_id in range(84, 88):
-            return self.get_great_flush_prob(action_id)
+            return self.get_great_flush_prob(action_id, cards, row)
         else:
             raise ValueError("action_id must be from 0 to 87 (inclusive)")
 
-    def get_highcard_prob(self, action_id):
+    def get_highcard_prob(self, action_id, cards, row):
         # High card
-        if action_id in self.cards.values:
+        if cards.value_counts[action_id]:
             return 1.0
-        return self.get_table_value("highcard")
+        return row[pt.BetType.HIGHCARD]
 
-    def get_pair_prob(self, action_id):
+    def get_pair_prob(self, action_id, cards, row):
         # Pair
         value = self.card_values_for_bet[action_id][0]
-        if len(self.cards.with_value[value]) >= 2:
+        if cards.value_counts[value] >= 2:
             return 1.0
-        if len(self.cards.with_value[value]) == 1:
-            return self.get_table_value(pt.BetType.PAIR_HAVE_1)
-        return self.get_table_value(pt.BetType.PAIR)
+        if cards.value_counts[value] == 1:
+            return row[pt.BetType.PAIR_HAVE_1]
+        return row[pt.BetType.PAIR]
 
-    def get_twopairs_prob(self, action_id):
+    def get_twopairs_prob(self, action_id, cards, row):
         # Two pairs
         value_1, value_2 = self.card_values_for_bet[action_id]
-        value_1_num = len(self.cards.with_value[value_1])
-        value_2_num = len(self.cards.with_value[value_2])
+        value_1_num = cards.value_counts[value_1]
+        value_2_num = cards.value_counts[value_2]
         if value_1_num >= 2 and value_2_num >= 2:
             return 1.0
         if value_1_num >= 2 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.PAIR_HAVE_1)
+            return row[pt.BetType.PAIR_HAVE_1]
         if value_1_num == 1 and value_2_num >= 2:
-            return self.get_table_value(pt.BetType.PAIR_HAVE_1)
+            return row[pt.BetType.PAIR_HAVE_1]
         if value_1_num >= 2 and value_2_num == 0:
-            return self.get_table_value(pt.BetType.PAIR)
+            return row[pt.BetType.PAIR]
         if value_1_num == 0 and value_2_num >= 2:
-            return self.get_table_value(pt.BetType.PAIR)
+            return row[pt.BetType.PAIR]
         if value_1_num == 1 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.TWOPAIRS_HAVE_1_HAVE_1)
+            return row[pt.BetType.TWOPAIRS_HAVE_1_HAVE_1]
         if value_1_num == 1 and value_2_num == 0:
-            return self.get_table_value(pt.BetType.TWOPAIRS_HAVE_1)
+            return row[pt.BetType.TWOPAIRS_HAVE_1]
         if value_1_num == 0 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.TWOPAIRS_HAVE_1)
-        return self.get_table_value(pt.BetType.TWOPAIRS)
+            return row[pt.BetType.TWOPAIRS_HAVE_1]
+        return row[pt.BetType.TWOPAIRS]
 
-    def get_straight_prob(self, action_id):
+    def get_straight_prob(self, action_id, cards, row):
         # Small straight & Big straight
-        have_n_cards = sum([bool(self.cards.with_value[value]) for value in self.card_values_for_bet[action_id]])
+        have_n_cards = POPCOUNT[cards.value_mask & self.value_mask_for_bet[action_id]]
         if have_n_cards == 5:
             return 1.0
         if have_n_cards == 4:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_4)
+            return row[pt.BetType.STRAIGHT_HAVE_4]
         if have_n_cards == 3:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_3)
+            return row[pt.BetType.STRAIGHT_HAVE_3]
         if have_n_cards == 2:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_2)
+            return row[pt.BetType.STRAIGHT_HAVE_2]
         if have_n_cards == 1:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_1)
-        return self.get_table_value(pt.BetType.STRAIGHT)
+            return row[pt.BetType.STRAIGHT_HAVE_1]
+        return row[pt.BetType.STRAIGHT]
 
-    def get_great_straight_prob(self):
+    def get_great_straight_prob(self, cards, row):
         # Great straight
-        have_n_cards = sum([bool(self.cards.with_value[value]) for value in self.cards.with_value])
+        have_n_cards = POPCOUNT[cards.value_mask]
         if have_n_cards == 6:
             return 1.0
         if have_n_cards == 5:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_4)
+            return row[pt.BetType.STRAIGHT_HAVE_4]
         if have_n_cards == 4:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_3)
+            return row[pt.BetType.STRAIGHT_HAVE_3]
         if have_n_cards == 3:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_2)
+            return row[pt.BetType.STRAIGHT_HAVE_2]
         if have_n_cards == 2:
-            return self.get_table_value(pt.BetType.STRAIGHT_HAVE_1)
+            return row[pt.BetType.STRAIGHT_HAVE_1]
         if have_n_cards == 1:
-            return self.get_table_value(pt.BetType.STRAIGHT)
-        return self.get_table_value(pt.BetType.GREAT_STRAIGHT)
+            return row[pt.BetType.STRAIGHT]
+        return row[pt.BetType.GREAT_STRAIGHT]
 
-    def get_three_prob(self, action_id):
+    def get_three_prob(self, action_id, cards, row):
         # Three of a kind
         value = self.card_values_for_bet[action_id][0]
-        if len(self.cards.with_value[value]) >= 3:
+        if cards.value_counts[value] >= 3:
             return 1.0
-        if len(self.cards.with_value[value]) == 2:
-            return self.get_table_value(pt.BetType.THREE_HAVE_2)
-        if len(self.cards.with_value[value]) == 1:
-            return self.get_table_value(pt.BetType.THREE_HAVE_1)
-        return self.get_table_value(pt.BetType.THREE)
+        if cards.value_counts[value] == 2:
+            return row[pt.BetType.THREE_HAVE_2]
+        if cards.value_counts[value] == 1:
+            return row[pt.BetType.THREE_HAVE_1]
+        return row[pt.BetType.THREE]
 
-    def get_fullhouse_prob(self, action_id):
+    def get_fullhouse_prob(self, action_id, cards, row):
         # Full house
         value_1, value_2 = self.card_values_for_bet[action_id]
-        value_1_num = len(self.cards.with_value[value_1])
-        value_2_num = len(self.cards.with_value[value_2])
+        value_1_num = cards.value_counts[value_1]
+        value_2_num = cards.value_counts[value_2]
         if value_1_num >= 3 and value_2_num >= 2:
             return 1.0
         if value_1_num == 2 and value_2_num == 2:
-            return self.get_table_value(pt.BetType.THREE_HAVE_2)
+            return row[pt.BetType.THREE_HAVE_2]
         if value_1_num == 1 and value_2_num == 2:
-            return self.get_table_value(pt.BetType.THREE_HAVE_1)
+            return row[pt.BetType.THREE_HAVE_1]
         if value_1_num == 0 and value_2_num == 2:
-            return self.get_table_value(pt.BetType.THREE)
+            return row[pt.BetType.THREE]
         if value_1_num >= 3 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.PAIR_HAVE_1)
+            return row[pt.BetType.PAIR_HAVE_1]
         if value_1_num == 2 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.FULLHOUSE_HAVE_2_AND_1)
+            return row[pt.BetType.FULLHOUSE_HAVE_2_AND_1]
         if value_1_num == 1 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.FULLHOUSE_HAVE_1_AND_1)
+            return row[pt.BetType.FULLHOUSE_HAVE_1_AND_1]
         if value_1_num == 0 and value_2_num == 1:
-            return self.get_table_value(pt.BetType.FULLHOUSE_HAVE_0_AND_1)
+            return row[pt.BetType.FULLHOUSE_HAVE_0_AND_1]
         if value_1_num >= 3 and value_2_num == 0:
-            return self.get_table_value(pt.BetType.PAIR)
+            return row[pt.BetType.PAIR]
         if value_1_num == 2 and value_2_num == 0:
-            return self.get_table_value(pt.BetType.FULLHOUSE_HAVE_2_AND_0)
+            return row[pt.BetType.FULLHOUSE_HAVE_2_AND_0]
         if value_1_num == 1 and value_2_num == 0:
-            return self.get_table_value(pt.BetType.FULLHOUSE_HAVE_1_AND_0)
-        return self.get_table_value(pt.BetType.FULLHOUSE)
+            return row[pt.BetType.FULLHOUSE_HAVE_1_AND_0]
+        return row[pt.BetType.FULLHOUSE]
 
-    def get_colour_prob(self, action_id):
+    def get_colour_prob(self, action_id, cards, row):
         # Colour
         colour = self.card_colour_for_bet[action_id]
-        if len(self.cards.with_colour[colour]) >= 5:
+        if cards.colour_counts[colour] >= 5:
             return 1.0
-        if len(self.cards.with_colour[colour]) == 4:
-            return self.get_table_value(pt.BetType.COLOUR_HAVE_4)
-        if len(self.cards.with_colour[colour]) == 3:
-            return self.get_table_value(pt.BetType.COLOUR_HAVE_3)
-        if len(self.cards.with_colour[colour]) == 2:
-            return self.get_table_value(pt.BetType.COLOUR_HAVE_2)
-        if len(self.cards.with_colour[colour]) == 1:
-            return self.get_table_value(pt.BetType.COLOUR_HAVE_1)
-        return self.get_table_value(pt.BetType.COLOUR)
-
-    def get_four_prob(self, action_id):
+        if cards.colour_counts[colour] == 4:
+            return row[pt.BetType.COLOUR_HAVE_4]
+        if cards.colour_counts[colour] == 3:
+            return row[pt.BetType.COLOUR_HAVE_3]
+        if cards.colour_counts[colour] == 2:
+            return row[pt.BetType.COLOUR_HAVE_2]
+        if cards.colour_counts[colour] == 1:
+            return row[pt.BetType.COLOUR_HAVE_1]
+        return row[pt.BetType.COLOUR]
+
+    def get_four_prob(self, action_id, cards, row):
         # Four of a kind
         value = self.card_values_for_bet[action_id][0]
-        if len(self.cards.with_value[value]) == 4:
+        if cards.value_counts[value] == 4:
             return 1.0
-        if len(self.cards.with_value[value]) == 3:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_3)
-        if len(self.cards.with_value[value]) == 2:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_2)
-        if len(self.cards.with_value[value]) == 1:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_1)
-        return self.get_table_value(pt.BetType.FOUR)
-
-    def get_flush_prob(self, action_id):
+        if cards.value_counts[value] == 3:
+            return row[pt.BetType.FOUR_HAVE_3]
+        if cards.value_counts[value] == 2:
+            return row[pt.BetType.FOUR_HAVE_2]
+        if cards.value_counts[value] == 1:
+            return row[pt.BetType.FOUR_HAVE_1]
+        return row[pt.BetType.FOUR]
+
+    def get_flush_prob(self, action_id, cards, row):
         # Small flush & big flush
         colour = self.card_colour_for_bet[action_id]
-        relevant_cards = [card for value in self.card_values_for_bet[action_id] for card in self.cards.with_value[value]]
-        have_n_cards = len(Cards.group_cards(relevant_cards, by="colour")[colour])
+        have_n_cards = POPCOUNT[cards.colour_masks[colour] & self.value_mask_for_bet[action_id]]
         if have_n_cards == 5:
             return 1.0
         if have_n_cards == 4:
-            return self.get_table_value(pt.BetType.FLUSH_HAVE_4)
+            return row[pt.BetType.FLUSH_HAVE_4]
         if have_n_cards == 3:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_3)
+            return row[pt.BetType.FOUR_HAVE_3]
         if have_n_cards == 2:
-            return self.get_table_value(pt.BetType.FLUSH_HAVE_2)
+            return row[pt.BetType.FLUSH_HAVE_2]
         if have_n_cards == 1:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_1)
-        return self.get_table_value(pt.BetType.FLUSH)
+            return row[pt.BetType.FOUR_HAVE_1]
+        return row[pt.BetType.FLUSH]
 
-    def get_great_flush_prob(self, action_id):
+    def get_great_flush_prob(self, action_id, cards, row):
         # Great flush
         colour = self.card_colour_for_bet[action_id]
-        have_n_cards = len(self.cards.with_colour[colour])
+        have_n_cards = cards.colour_counts[colour]
         if have_n_cards == 6:
             return 1.0
         if have_n_cards == 5:
-            return self.get_table_value(pt.BetType.FLUSH_HAVE_4)
+            return row[pt.BetType.FLUSH_HAVE_4]
         if have_n_cards == 4:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_3)
+            return row[pt.BetType.FOUR_HAVE_3]
         if have_n_cards == 3:
-            return self.get_table_value(pt.BetType.FLUSH_HAVE_2)
+            return row[pt.BetType.FLUSH_HAVE_2]
         if have_n_cards == 2:
-            return self.get_table_value(pt.BetType.FOUR_HAVE_1)
+            return row[pt.BetType.FOUR_HAVE_1]
         if have_n_cards == 1:
-            return self.get_table_value(pt.BetType.FLUSH)
-        return self.get_table_value(pt.BetType.FLUSH_GREAT)
+            return row[pt.BetType.FLUSH]
+        return row[pt.BetType.FLUSH_GREAT]
+
+
+_shared_handler = None
+_shared_handler_lock = threading.Lock()
+
+
+def get_shared_handler():
+    """
+        Get the process-wide Handler - it loads the probability table
+        on the first query only. Its cache is shared by the whole process.
+        return: handler(Handler)
+    """
+    global _shared_handler
+    if _shared_handler is None:
+        with _shared_handler_lock:
+            if _shared_handler is None:
+                _shared_handler = Handler()
+    return _shared_handler
+
+
+def reload_shared_handler():
+    """
+        Re-read the probability table and replace the process-wide Handler
+        (e.g. after regenerating the table)
+        return: handler(Handler)
+    """
+    global _shared_handler
+    new_handler = Handler(probs_table=pt.get(refresh=True))
+    with _shared_handler_lock:
+        _shared_handler = new_handler
+    return new_handler
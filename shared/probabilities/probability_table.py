@@ -1,345 +1,398 @@
+import os
 from os import path
-from itertools import product
+from multiprocessing import Pool
+import hashlib
 import csv
 from math import comb
+import numpy as np
 
 
 class BetType(object):
     """
         Class for constant storage -
-        bet type string literals for use with the probability table
+        bet type column ids for use with the probability table
+        (the last axis of the table array)
     """
-    HIGHCARD = "highcard"
-    PAIR_HAVE_1 = "pair_have_1"
-    THREE_HAVE_2 = "three_have_2"
-    FOUR_HAVE_3 = "four_have_3"
-    PAIR = "pair"
-    THREE_HAVE_1 = "three_have_1"
-    FOUR_HAVE_2 = "four_have_2"
-    TWOPAIRS = "twopairs"
-    TWOPAIRS_HAVE_1 = "twopairs_have_1"
-    TWOPAIRS_HAVE_1_HAVE_1 = "twopairs_have_1_have_1"
-    THREE = "three"
-    FOUR_HAVE_1 = "four_have_1"
-    FOUR = "four"
-    COLOUR = "colour"
-    COLOUR_HAVE_1 = "colour_have_1"
-    COLOUR_HAVE_2 = "colour_have_2"
-    COLOUR_HAVE_3 = "colour_have_3"
-    COLOUR_HAVE_4 = "colour_have_4"
-    GREAT_STRAIGHT = "great_straight"
-    STRAIGHT = "straight"
-    STRAIGHT_HAVE_1 = "straight_have_1"
-    STRAIGHT_HAVE_2 = "straight_have_2"
-    STRAIGHT_HAVE_3 = "straight_have_3"
-    STRAIGHT_HAVE_4 = "straight_have_4"
-    FLUSH = "flush"
-    FLUSH_HAVE_1 = "flush_have_1"
-    FLUSH_HAVE_2 = "flush_have_2"
-    FLUSH_HAVE_3 = "flush_have_3"
-    FLUSH_HAVE_4 = "flush_have_4"
-    FLUSH_GREAT = "flush_great"
-    FULLHOUSE = "fullhouse"
-    FULLHOUSE_HAVE_1_AND_0 = "fullhouse_have_1_and_0"
-    FULLHOUSE_HAVE_2_AND_0 = "fullhouse_have_2_and_0"
-    FULLHOUSE_HAVE_0_AND_1 = "fullhouse_have_0_and_1"
-    FULLHOUSE_HAVE_1_AND_1 = "fullhouse_have_1_and_1"
-    FULLHOUSE_HAVE_2_AND_1 = "fullhouse_have_2_and_1"
+    HIGHCARD = 0
+    PAIR_HAVE_1 = 1
+    THREE_HAVE_2 = 2
+    FOUR_HAVE_3 = 3
+    PAIR = 4
+    THREE_HAVE_1 = 5
+    FOUR_HAVE_2 = 6
+    TWOPAIRS = 7
+    TWOPAIRS_HAVE_1 = 8
+    TWOPAIRS_HAVE_1_HAVE_1 = 9
+    THREE = 10
+    FOUR_HAVE_1 = 11
+    FOUR = 12
+    COLOUR = 13
+    COLOUR_HAVE_1 = 14
+    COLOUR_HAVE_2 = 15
+    COLOUR_HAVE_3 = 16
+    COLOUR_HAVE_4 = 17
+    GREAT_STRAIGHT = 18
+    STRAIGHT = 19
+    STRAIGHT_HAVE_1 = 20
+    STRAIGHT_HAVE_2 = 21
+    STRAIGHT_HAVE_3 = 22
+    STRAIGHT_HAVE_4 = 23
+    FLUSH = 24
+    FLUSH_HAVE_1 = 25
+    FLUSH_HAVE_2 = 26
+    FLUSH_HAVE_3 = 27
+    FLUSH_HAVE_4 = 28
+    FLUSH_GREAT = 29
+    FULLHOUSE = 30
+    FULLHOUSE_HAVE_1_AND_0 = 31
+    FULLHOUSE_HAVE_2_AND_0 = 32
+    FULLHOUSE_HAVE_0_AND_1 = 33
+    FULLHOUSE_HAVE_1_AND_1 = 34
+    FULLHOUSE_HAVE_2_AND_1 = 35
+
+
+# Column names used in the CSV header, indexed by BetType column id
+BET_TYPE_NAMES = (
+    "highcard",
+    "pair_have_1",
+    "three_have_2",
+    "four_have_3",
+    "pair",
+    "three_have_1",
+    "four_have_2",
+    "twopairs",
+    "twopairs_have_1",
+    "twopairs_have_1_have_1",
+    "three",
+    "four_have_1",
+    "four",
+    "colour",
+    "colour_have_1",
+    "colour_have_2",
+    "colour_have_3",
+    "colour_have_4",
+    "great_straight",
+    "straight",
+    "straight_have_1",
+    "straight_have_2",
+    "straight_have_3",
+    "straight_have_4",
+    "flush",
+    "flush_have_1",
+    "flush_have_2",
+    "flush_have_3",
+    "flush_have_4",
+    "flush_great",
+    "fullhouse",
+    "fullhouse_have_1_and_0",
+    "fullhouse_have_2_and_0",
+    "fullhouse_have_0_and_1",
+    "fullhouse_have_1_and_1",
+    "fullhouse_have_2_and_1",
+)
+
+N_BET_TYPES = len(BET_TYPE_NAMES)
+MAX_PLAYER_CARDS = 12
+MAX_CARDS = 24
+TABLE_SHAPE = (MAX_PLAYER_CARDS, MAX_CARDS + 1, N_BET_TYPES)
+
+# Table file format version - bump when the layout of the binary file changes
+FORMAT_VERSION = 1
+# The precomputed table ships with the package, next to this module
+TABLE_DIR = path.dirname(path.abspath(__file__))
+BINARY_FILENAME = path.join(TABLE_DIR, "bet_probabilities.npz")
+# The memory-mapped export is written at runtime, so it goes to a user cache
+# directory - $BLEF_CACHE_DIR, or blef/ under $XDG_CACHE_HOME or ~/.cache
+CACHE_DIR = os.environ.get("BLEF_CACHE_DIR") or path.join(
+    os.environ.get("XDG_CACHE_HOME") or path.join(path.expanduser("~"), ".cache"), "blef")
+MMAP_FILENAME = path.join(CACHE_DIR, "bet_probabilities.npy")
+
+# How to count the occurances of each bet type, as
+# (card groups, minimal n, maximal n), where each card group is
+# (cards in the group still unseen, minimal cards needed, maximal cards possible)
+# e.g. a pair, having 1 card of the value: 3 unseen cards, 1 to 3 of them needed
+# The remaining 24 - n - (unseen cards in all groups) cards can be anything.
+BET_TYPE_GROUPS = {
+    BetType.HIGHCARD: ([(4, 1, 4)], 0, 11),
+    BetType.PAIR_HAVE_1: ([(3, 1, 3)], 0, 11),
+    BetType.THREE_HAVE_2: ([(2, 1, 2)], 0, 11),
+    BetType.FOUR_HAVE_3: ([(1, 1, 1)], 0, 11),
+    BetType.PAIR: ([(4, 2, 4)], 0, 11),
+    BetType.THREE_HAVE_1: ([(3, 2, 3)], 0, 11),
+    BetType.FOUR_HAVE_2: ([(2, 2, 2)], 0, 11),
+    BetType.TWOPAIRS: ([(4, 2, 4), (4, 2, 4)], 0, 11),
+    BetType.TWOPAIRS_HAVE_1: ([(3, 1, 3), (4, 2, 4)], 0, 11),
+    BetType.TWOPAIRS_HAVE_1_HAVE_1: ([(3, 1, 3), (3, 1, 3)], 0, 11),
+    BetType.THREE: ([(4, 3, 4)], 0, 11),
+    BetType.FOUR_HAVE_1: ([(3, 3, 3)], 0, 11),
+    BetType.FOUR: ([(4, 4, 4)], 0, 11),
+    BetType.COLOUR: ([(6, 5, 6)], 0, 11),
+    BetType.COLOUR_HAVE_1: ([(5, 4, 5)], 1, 11),
+    BetType.COLOUR_HAVE_2: ([(4, 3, 4)], 2, 11),
+    BetType.COLOUR_HAVE_3: ([(3, 2, 3)], 3, 11),
+    BetType.COLOUR_HAVE_4: ([(2, 1, 2)], 4, 11),
+    BetType.GREAT_STRAIGHT: ([(4, 1, 4)] * 6, 0, 0),
+    BetType.STRAIGHT: ([(4, 1, 4)] * 5, 0, 11),
+    BetType.STRAIGHT_HAVE_1: ([(4, 1, 4)] * 4, 1, 11),
+    BetType.STRAIGHT_HAVE_2: ([(4, 1, 4)] * 3, 2, 11),
+    BetType.STRAIGHT_HAVE_3: ([(4, 1, 4)] * 2, 3, 11),
+    BetType.STRAIGHT_HAVE_4: ([(4, 1, 4)], 4, 11),
+    BetType.FLUSH: ([(5, 5, 5)], 0, 11),
+    BetType.FLUSH_HAVE_1: ([(4, 4, 4)], 1, 11),
+    BetType.FLUSH_HAVE_2: ([(3, 3, 3)], 2, 11),
+    BetType.FLUSH_HAVE_3: ([(2, 2, 2)], 3, 11),
+    BetType.FLUSH_HAVE_4: ([(1, 1, 1)], 4, 11),
+    BetType.FLUSH_GREAT: ([(6, 6, 6)], 0, 11),
+    BetType.FULLHOUSE: ([(4, 3, 4), (4, 2, 4)], 0, 11),
+    BetType.FULLHOUSE_HAVE_1_AND_0: ([(3, 2, 3), (4, 2, 4)], 1, 11),
+    BetType.FULLHOUSE_HAVE_2_AND_0: ([(2, 1, 2), (4, 2, 4)], 2, 11),
+    BetType.FULLHOUSE_HAVE_0_AND_1: ([(4, 3, 4), (3, 1, 3)], 1, 11),
+    BetType.FULLHOUSE_HAVE_1_AND_1: ([(3, 2, 3), (3, 1, 3)], 2, 11),
+    BetType.FULLHOUSE_HAVE_2_AND_1: ([(2, 1, 2), (3, 1, 3)], 3, 11),
+}
+
 
 def binom(n, k):
     if n < 0 or k < 0:
         return 0
     return comb(n, k)
 
-def generate(filename="bet_probabilities.csv"):
+
+def binom_table(size=MAX_CARDS + 1):
+    """
+        return: np.ndarray of int64, where [n, k] = binom(n, k)
+    """
+    return np.array([[binom(n, k) for k in range(size)] for n in range(size)], dtype=np.int64)
+
+
+def group_polynomial(groups):
+    """
+        Generating function of the card groups - the coefficient of x^c is the
+        number of ways to draw c cards from the groups, with each group satisfied
+        return: polynomial coefficients(np.ndarray of int64)
+    """
+    polynomial = np.ones(1, dtype=np.int64)
+    for unseen, needed, possible in groups:
+        group = np.zeros(possible + 1, dtype=np.int64)
+        group[needed:] = [binom(unseen, c) for c in range(needed, possible + 1)]
+        polynomial = np.convolve(polynomial, group)
+    return polynomial
+
+
+def generate_rows(card_nums):
+    """
+        Compute the table rows for the given player card numbers n
+        (see generate), by convolving the generating function of each bet type
+        with the one of the remaining cards, (1 + x)^(24 - n - unseen cards in groups)
+        return: np.ndarray of shape (len(card_nums),) + TABLE_SHAPE[1:]
     """
-        Generate a dataframe of conditional probabilities
+    binoms = binom_table()
+    polynomials = {bet_type: group_polynomial(groups) for bet_type, (groups, _, _) in BET_TYPE_GROUPS.items()}
+    rows = np.full((len(card_nums),) + TABLE_SHAPE[1:], np.nan)
+    for i, n in enumerate(card_nums):
+        others_card_nums = np.arange(1, MAX_CARDS + 1 - n)
+        all_states = binoms[MAX_CARDS - n, others_card_nums]
+        for bet_type, (groups, min_n, max_n) in BET_TYPE_GROUPS.items():
+            frequency = np.zeros(MAX_CARDS + 1, dtype=np.int64)
+            remaining = MAX_CARDS - n - sum(unseen for unseen, _, _ in groups)
+            if min_n <= n <= max_n and remaining >= 0:
+                convolution = np.convolve(polynomials[bet_type], binoms[remaining, :remaining + 1])
+                frequency[:len(convolution)] = convolution[:MAX_CARDS + 1]
+            rows[i, others_card_nums, bet_type] = frequency[others_card_nums] / all_states
+    return rows
+
+
+def generate(filename=None, binary_filename=BINARY_FILENAME, processes=1):
+    """
+        Generate a table of conditional probabilities
         of the occurance of a bet, given
         n = number of cards of the player
         o = number of cards of other players
-        The rows are indexed with an integer:
-        100*n + o
-        i.e. 305 = I have 3 cards and others have 5,
-             1012 = I have 10 cards and others have 12
-        Rows indexed 1-24 are unconditional probabilities 
+        The table is a float64 array of shape TABLE_SHAPE, indexed with
+        [n, o, bet_type], where bet_type is a BetType column id
+        i.e. table[3, 5, BetType.PAIR] = I have 3 cards and others have 5
+        Rows with n = 0 are unconditional probabilities
         (an outside observer's perspective)
+        Entries for impossible (n, o) pairs are NaN.
+        In the CSV, rows are indexed with an integer: 100*n + o
+        processes > 1 spreads the rows over a process pool
+        This is an offline step - the result is saved to binary_filename
+        (the table shipped with the package), and optionally to a CSV
     """
-    rows = []
-    # Enumerate n (your card number) and o (other player card number) combinations
-    for player_card_num in range(12):
-        for others_card_num in range(1, 25-player_card_num):
-
-            n = player_card_num
-            o = others_card_num
-
-            # Compute all possibilities - omega
-            all_states = binom(24-n, o)
-
-            # High card
-            frequency = sum([binom(4, i) * binom(24-n-4, o-i) for i in range(1, 5)])
-            highcard_prob = frequency / all_states
-
-            # Pair have 1
-            frequency = sum([binom(3, i) * binom(24-n-3, o-i) for i in range(1, 4)])
-            pair_have_1_prob = frequency / all_states
-
-            # Three have 2
-            frequency = sum([binom(2, i) * binom(24-n-2, o-i) for i in range(1, 3)])
-            three_have_2_prob = frequency / all_states
-
-            # Four have 3
-            frequency = binom(24-n-1, o-1)
-            four_have_3_prob = frequency / all_states
-
-            # Pair
-            frequency = sum([binom(4, i) * binom(24-n-4, o-i) for i in range(2, 5)])
-            pair_prob = frequency / all_states
-
-            # Three have 1
-            frequency = sum([binom(3, i) * binom(24-n-3, o-i) for i in range(2, 4)])
-            three_have_1_prob = frequency / all_states
-
-            # Four have 2
-            frequency = binom(24-n-2, o-2)
-            four_have_2_prob = frequency / all_states
-
-            # Two pairs
-            occurance_combinations = product(range(2, 5), range(2, 5))
-            frequency = sum([binom(4, c1)*binom(4, c2)*binom(24-n-8, o-c1-c2) for c1, c2 in occurance_combinations])
-            twopairs_prob = frequency / all_states
-
-            # Two pairs have 1
-            occurance_combinations = product(range(1, 4), range(2, 5))
-            frequency = sum([binom(3, c1)*binom(4, c2)*binom(24-n-7, o-c1-c2) for c1, c2 in occurance_combinations])
-            twopairs_have_1_prob = frequency / all_states
-
-            # Two pairs have 1 have 1
-            occurance_combinations = product(range(1, 4), range(1, 4))
-            frequency = sum([binom(3, c1)*binom(3, c2)*binom(24-n-6, o-c1-c2) for c1, c2 in occurance_combinations])
-            twopairs_have_1_have_1_prob = frequency / all_states
-
-            # Three
-            frequency = binom(4, 3) * binom(24-n-4, o-3) + binom(4,4) * binom(24-n-4, o-4)
-            three_prob = frequency / all_states
-
-            # Four have 1
-            frequency = binom(24-n-3, o-3)
-            four_have_1_prob = frequency / all_states
-
-            # Four
-            frequency = binom(24-n-4, o-4)
-            four_prob = frequency / all_states
-
-            # Colour
-            frequency = binom(6,5) * binom(24-n-6, o-5) + binom(6,6) * binom(24-n-6, o-6)
-            colour_prob = frequency / all_states
-
-            # Colour have 1
-            frequency = 0
-            if n >= 1:
-                frequency = binom(5,4) * binom(24-n-5, o-4) + binom(5,5) * binom(24-n-5, o-5)
-            colour_have_1_prob = frequency / all_states
-
-            # Colour have 2
-            frequency = 0
-            if n >= 2:
-                frequency = binom(4,3) * binom(24-n-4, o-3) + binom(4,4) * binom(24-n-4, o-4)
-            colour_have_2_prob = frequency / all_states
-
-            # Colour have 3
-            frequency = 0
-            if n >= 3:
-                frequency = binom(3,2) * binom(24-n-3, o-2) + binom(3,3) * binom(24-n-3, o-3)
-            colour_have_3_prob = frequency / all_states
-
-            # Colour have 4
-            frequency = 0
-            if n >= 4:
-                frequency = binom(2,1) * binom(24-n-2, o-1) + binom(2,2) * binom(24-n-2, o-2)
-            colour_have_4_prob = frequency / all_states
-
-            # Great straight
-            frequency = 0
-            if n == 0:
-                occurance_combinations = product(range(1, 5), range(1, 5), range(1, 5), range(1, 5), range(1, 5), range(1, 5))
-                frequency = sum([binom(4, c1)*binom(4, c2)*binom(4, c3)*binom(4, c4)*binom(4, c5)*binom(4, c6) for c1, c2, c3, c4, c5, c6 in occurance_combinations if c1+c2+c3+c4+c5+c6==o])
-            great_straight_prob = frequency / all_states
-
-            # Straight
-            occurance_combinations = product(range(1, 5), range(1, 5), range(1, 5), range(1, 5), range(1, 5))
-            frequency = sum([binom(4, c1)*binom(4, c2)*binom(4, c3)*binom(4, c4)*binom(4, c5)*binom(24-n-5*4, o-c1-c2-c3-c4-c5) for c1, c2, c3, c4, c5 in occurance_combinations])
-            straight_prob = frequency / all_states
-
-            # Straight have 1
-            frequency = 0
-            if n >= 1:
-                occurance_combinations = product(range(1, 5), range(1, 5), range(1, 5), range(1, 5))
-                frequency = sum([binom(4, c1)*binom(4, c2)*binom(4, c3)*binom(4, c4)*binom(24-n-4*4, o-c1-c2-c3-c4) for c1, c2, c3, c4 in occurance_combinations])
-            straight_have_1_prob = frequency / all_states
-
-            # Straight have 2
-            frequency = 0
-            if n >= 2:
-                occurance_combinations = product(range(1, 5), range(1, 5), range(1, 5))
-                frequency = sum([binom(4, c1)*binom(4, c2)*binom(4, c3)*binom(24-n-3*4, o-c1-c2-c3) for c1, c2, c3 in occurance_combinations])
-            straight_have_2_prob = frequency / all_states
-
-            # Straight have 3
-            frequency = 0
-            if n >= 3:
-                occurance_combinations = product(range(1, 5), range(1, 5))
-                frequency = sum([binom(4, c1)*binom(4, c2)*binom(24-n-2*4, o-c1-c2) for c1, c2 in occurance_combinations])
-            straight_have_3_prob = frequency / all_states
-
-            # Straight have 4
-            frequency = 0
-            if n >= 4:
-                occurance_combinations = range(1, 5)
-                frequency = sum([binom(4, c1)*binom(24-n-4, o-c1) for c1 in occurance_combinations])
-            straight_have_4_prob = frequency / all_states
-
-            # Flush
-            frequency = binom(24-n-5, o-5)
-            flush_prob = frequency / all_states
-
-            # Flush have 1
-            frequency = 0
-            if n >= 1:
-                frequency = binom(24-n-4, o-4)
-            flush_have_1_prob = frequency / all_states
-
-            # Flush have 2
-            frequency = 0
-            if n >= 2:
-                frequency = binom(24-n-3, o-3)
-            flush_have_2_prob = frequency / all_states
-
-            # Flush have 3
-            frequency = 0
-            if n >= 3:
-                frequency = binom(24-n-2, o-2)
-            flush_have_3_prob = frequency / all_states
-
-            # Flush have 4
-            frequency = 0
-            if n >= 4:
-                frequency = binom(24-n-1, o-1)
-            flush_have_4_prob = frequency / all_states
-
-            # Flush great
-            frequency = binom(24-n-6, o-6)
-            flush_great_prob = frequency / all_states
-
-            # Full house
-            occurance_combinations = product(range(3, 5), range(2, 5))
-            frequency = sum([binom(4, c1)*binom(4, c2)*binom(24-n-8, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_prob = frequency / all_states
-
-            # Full house have 0 and 1
-            occurance_combinations = product(range(3, 5), range(1, 4))
-            frequency = 0
-            if n >= 1:
-                frequency = sum([binom(4, c1)*binom(3, c2)*binom(24-n-7, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_have_0_and_1_prob = frequency / all_states
-
-            # Full house have 1 and 0
-            occurance_combinations = product(range(2, 4), range(2, 5))
-            frequency = 0
-            if n >= 1:
-                frequency = sum([binom(3, c1)*binom(4, c2)*binom(24-n-7, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_have_1_and_0_prob = frequency / all_states
-
-            # Full house have 1 and 1
-            occurance_combinations = product(range(2, 4), range(1, 4))
-            frequency = 0
-            if n >= 2:
-                frequency = sum([binom(3, c1)*binom(3, c2)*binom(24-n-6, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_have_1_and_1_prob = frequency / all_states
-
-            # Full house have 2 and 0
-            occurance_combinations = product(range(1, 3), range(2, 5))
-            frequency = 0
-            if n >= 2:
-                frequency = sum([binom(2, c1)*binom(4, c2)*binom(24-n-6, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_have_2_and_0_prob = frequency / all_states
-
-            # Full house have 2 and 1
-            occurance_combinations = product(range(1, 3), range(1, 4))
-            frequency = 0
-            if n >= 3:
-                frequency = sum([binom(2, c1)*binom(3, c2)*binom(24-n-5, o-c1-c2) for c1, c2 in occurance_combinations])
-            fullhouse_have_2_and_1_prob = frequency / all_states
-
-            # Row index
-            index = n*100 + o
-
-            row = {
-                "index": index,
-                BetType.HIGHCARD: highcard_prob,
-                BetType.PAIR_HAVE_1: pair_have_1_prob,
-                BetType.THREE_HAVE_2: three_have_2_prob,
-                BetType.FOUR_HAVE_3: four_have_3_prob,
-                BetType.PAIR: pair_prob,
-                BetType.THREE_HAVE_1: three_have_1_prob,
-                BetType.FOUR_HAVE_2: four_have_2_prob,
-                BetType.TWOPAIRS: twopairs_prob,
-                BetType.TWOPAIRS_HAVE_1: twopairs_have_1_prob,
-                BetType.TWOPAIRS_HAVE_1_HAVE_1: twopairs_have_1_have_1_prob,
-                BetType.THREE: three_prob,
-                BetType.FOUR_HAVE_1: four_have_1_prob,
-                BetType.FOUR: four_prob,
-                BetType.COLOUR: colour_prob,
-                BetType.COLOUR_HAVE_1: colour_have_1_prob,
-                BetType.COLOUR_HAVE_2: colour_have_2_prob,
-                BetType.COLOUR_HAVE_3: colour_have_3_prob,
-                BetType.COLOUR_HAVE_4: colour_have_4_prob,
-                BetType.GREAT_STRAIGHT: great_straight_prob,
-                BetType.STRAIGHT: straight_prob,
-                BetType.STRAIGHT_HAVE_1: straight_have_1_prob,
-                BetType.STRAIGHT_HAVE_2: straight_have_2_prob,
-                BetType.STRAIGHT_HAVE_3: straight_have_3_prob,
-                BetType.STRAIGHT_HAVE_4: straight_have_4_prob,
-                BetType.FLUSH: flush_prob,
-                BetType.FLUSH_HAVE_1: flush_have_1_prob,
-                BetType.FLUSH_HAVE_2: flush_have_2_prob,
-                BetType.FLUSH_HAVE_3: flush_have_3_prob,
-                BetType.FLUSH_HAVE_4: flush_have_4_prob,
-                BetType.FLUSH_GREAT: flush_great_prob,
-                BetType.FULLHOUSE: fullhouse_prob,
-                BetType.FULLHOUSE_HAVE_1_AND_0: fullhouse_have_1_and_0_prob,
-                BetType.FULLHOUSE_HAVE_2_AND_0: fullhouse_have_2_and_0_prob,
-                BetType.FULLHOUSE_HAVE_0_AND_1: fullhouse_have_0_and_1_prob,
-                BetType.FULLHOUSE_HAVE_1_AND_1: fullhouse_have_1_and_1_prob,
-                BetType.FULLHOUSE_HAVE_2_AND_1: fullhouse_have_2_and_1_prob
-            }
-
-            assert all(map(lambda x: (row[x] <= 1.0 or x == "index"), row)) # Probabilities need to <= 1.0
-            rows.append(row)
+    card_nums = list(range(MAX_PLAYER_CARDS))
+    if processes > 1:
+        with Pool(processes) as pool:
+            table = np.concatenate(pool.map(generate_rows, [[n] for n in card_nums]))
+    else:
+        table = generate_rows(card_nums)
 
+    if not validate(table): # Probabilities need to be in [0, 1]
+        raise ValueError("Generated an invalid probability table")
     if filename:
-        with open(filename, "w", newline="") as f:
-            writer = csv.DictWriter(f, rows[0].keys(), quoting=csv.QUOTE_NONNUMERIC)
-            writer.writeheader()
-            writer.writerows(rows)
-    return {row["index"]: row for row in rows}
+        save_csv(table, filename)
+    if binary_filename:
+        save_binary(table, binary_filename)
+    return table
+
+
+def valid_rows():
+    """
+        Iterate over the valid (n, o) pairs of the table
+        return: generator of (n, o) tuples
+    """
+    for n in range(MAX_PLAYER_CARDS):
+        for o in range(1, MAX_CARDS + 1 - n):
+            yield n, o
+
+
+def validate(table):
+    """
+        Check that the table has the expected shape
+        and a probability for every bet type in every valid row
+        return: is_valid(bool)
+    """
+    if not isinstance(table, np.ndarray) or table.shape != TABLE_SHAPE:
+        return False
+    rows = np.array(list(valid_rows()))
+    values = table[rows[:, 0], rows[:, 1]]
+    return bool(np.all((values >= 0.0) & (values <= 1.0)))
+
+
+def save_csv(table, filename="bet_probabilities.csv"):
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(("index",) + BET_TYPE_NAMES)
+        for n, o in valid_rows():
+            writer.writerow([n*100 + o] + table[n, o].tolist())
+
+
+def checksum(table):
+    """
+        return: SHA-256 hex digest of the table contents(str)
+    """
+    return hashlib.sha256(np.ascontiguousarray(table, dtype=np.float64).tobytes()).hexdigest()
+
+
+def save_binary(table, filename=BINARY_FILENAME):
+    """
+        Save the table in the versioned, checksummed binary format (.npz)
+    """
+    with open(filename, "wb") as f:
+        np.savez(f,
+                 format_version=np.array(FORMAT_VERSION),
+                 bet_type_names=np.array(BET_TYPE_NAMES),
+                 checksum=np.array(checksum(table)),
+                 table=table)
+
+
+def load_binary(filename=BINARY_FILENAME):
+    if filename and path.exists(filename):
+        with np.load(filename, allow_pickle=False) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError("Unsupported probability table format version: {}".format(int(data["format_version"])))
+            if tuple(data["bet_type_names"]) != BET_TYPE_NAMES:
+                raise ValueError("The probability table has unexpected columns")
+            table = data["table"]
+            if str(data["checksum"]) != checksum(table):
+                raise ValueError("The probability table checksum doesn't match: {}".format(filename))
+        return table
+    else:
+        raise FileNotFoundError("Got no valid filename. filename: {}".format(filename))
+
+
+def load_checksum(filename=BINARY_FILENAME):
+    """
+        Read only the checksum stored in the binary table
+        return: SHA-256 hex digest(str)
+    """
+    if filename and path.exists(filename):
+        with np.load(filename, allow_pickle=False) as data:
+            return str(data["checksum"])
+    else:
+        raise FileNotFoundError("Got no valid filename. filename: {}".format(filename))
+
+
+def save_mmap(table, filename=MMAP_FILENAME):
+    """
+        Save the table as a raw .npy file, which processes can memory-map
+        (see load_mmap). The file is replaced atomically, so processes
+        attaching concurrently never see a partially written table.
+    """
+    os.makedirs(path.dirname(path.abspath(filename)), exist_ok=True)
+    temporary_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(temporary_filename, "wb") as f:
+        np.save(f, np.ascontiguousarray(table, dtype=np.float64))
+    os.replace(temporary_filename, filename)
+
+
+def load_mmap(filename=MMAP_FILENAME):
+    """
+        Memory-map the table read-only - all processes attaching to the same file
+        share its pages instead of holding private copies
+        return: table(np.memmap)
+    """
+    if filename and path.exists(filename):
+        table = np.load(filename, mmap_mode="r", allow_pickle=False)
+        if table.shape != TABLE_SHAPE:
+            raise ValueError("The probability table has unexpected shape: {}".format(table.shape))
+        return table
+    else:
+        raise FileNotFoundError("Got no valid filename. filename: {}".format(filename))
 
 
 def load(filename="bet_probabilities.csv"):
     if filename and path.exists(filename):
+        table = np.full(TABLE_SHAPE, np.nan)
         with open(filename, 'r') as filehandle:
             dict_reader = csv.DictReader(filehandle, quoting=csv.QUOTE_NONNUMERIC)
-            return {row["index"]: row for row in dict_reader}
+            missing = set(BET_TYPE_NAMES + ("index",)) - set(dict_reader.fieldnames or ())
+            if missing:
+                raise ValueError("The probability table is missing columns: {}".format(sorted(missing)))
+            for row in dict_reader:
+                n, o = divmod(int(row["index"]), 100)
+                table[n, o] = [row[name] for name in BET_TYPE_NAMES]
+        return table
     else:
         raise FileNotFoundError("Got no valid filename. filename: {}".format(filename))
 
 
-def get():
+def get(mmap_filename=MMAP_FILENAME, binary_filename=BINARY_FILENAME, refresh=False):
+    """
+        Get the table, memory-mapped from mmap_filename if it exists
+        and matches the checksum of the packaged binary table.
+        Otherwise (or if refresh) load the packaged binary table and export it
+        to mmap_filename (under CACHE_DIR by default), so that other processes
+        can attach to it - if it can't be written, the loaded table is used as is.
+        The table is never generated here - run this module to generate it.
+        return: table(np.ndarray)
+    """
+    if not refresh:
+        try:
+            table = load_mmap(mmap_filename)
+        except (OSError, ValueError):
+            # Missing, unreadable or corrupted - export it again
+            table = None
+        if table is not None:
+            try:
+                # A regenerated binary table makes an older export stale
+                if checksum(table) == load_checksum(binary_filename):
+                    return table
+            except FileNotFoundError:
+                return table
     try:
-        return load()
+        table = load_binary(binary_filename)
     except FileNotFoundError:
-        return generate()
+        raise FileNotFoundError("No probability table at {}. Generate it with: python -m shared.probabilities.probability_table".format(binary_filename))
+    if mmap_filename:
+        try:
+            save_mmap(table, mmap_filename)
+            return load_mmap(mmap_filename)
+        except OSError:
+            pass
+    return table
 
 
 if __name__ == "__main__":
     """ Run script manually - generate and save a table of probabilities """
     table = generate()
+    print("Saved the probability table to {}".format(BINARY_FILENAME))